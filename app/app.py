@@ -2,37 +2,136 @@ import json
 import os
 import sys
 
-from flask import Flask, request, jsonify, Response, current_app
+from flask import Flask, request, jsonify, Response, current_app, stream_with_context
+from pydantic import ValidationError
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
-from app.cleaning_robot import BaseCleaningRobot, PremiumCleaningRobot
-from app.database import Database
-from app.map import Map
-from app.robot_path import RobotPath
+from app.cleaning_robot import BaseCleaningRobot, CleaningRobotConfig, PremiumCleaningRobot
+from app.database import Database, HistoryFilter, STATS_BUCKETS, WriteBehindConfig
+from app.map_cache import MapCache, MapCacheConfig
+from app.map_store import MapStore, MapStoreConfig
+from app.report import REPORT_FORMATS, CleaningReport
+from app.robot_path import RobotPath, RobotPathConfig
+from app.robot_registry import RegisteredRobot, RobotRegistry, RobotRegistryConfig, check_robot_type
+from app.simulation_pool import SimulationPool, SimulationPoolConfig
 
 MAX_FILE_SIZE = 2 * 1024 * 1024  # 2 MB limit
+MAX_BATCH_SIZE = 1000  # Maximum number of actions files in a batch
 
 my_app = Flask(__name__)
+write_behind_config = WriteBehindConfig()
+map_cache = MapCache(MapCacheConfig())
+map_store_config = MapStoreConfig()
+map_store = MapStore(map_store_config) if map_store_config.enabled else None
+robot_path_config = RobotPathConfig()
+simulation_pool_config = SimulationPoolConfig()
+cleaning_robot_config = CleaningRobotConfig()
+simulation_pool = (SimulationPool(simulation_pool_config, cleaning_robot_config.engine)
+                   if simulation_pool_config.enabled else None)
+
+# Robots of the single-robot endpoints, outside of the registry so that they are never evicted
+base_cleaning_robot = RegisteredRobot(BaseCleaningRobot(engine=cleaning_robot_config.engine))
+premium_cleaning_robot = RegisteredRobot(PremiumCleaningRobot(engine=cleaning_robot_config.engine))
+robot_registry = RobotRegistry(RobotRegistryConfig(), cleaning_robot_config.engine)
+
+
+def get_database():
+    # Determine database connection
+    if current_app.config['TESTING']:
+        return current_app.config['DATABASE']
+    database_conn = Database.connect()
+    # Bootstrap the schema on the first connection of the application, later calls only check a cached flag
+    database_conn.ensure_schema()
+    if write_behind_config.enabled:
+        # Save the cleaning sessions from a background thread instead of within the request
+        database_conn.enable_write_behind(write_behind_config)
+    return database_conn
+
+
+def bootstrap_database():
+    # Create the database schema once when the application starts
+    try:
+        Database.connect().ensure_schema()
+    except Exception as e:
+        my_app.logger.warning(f"Database schema bootstrap postponed to the first request: {e}")
+
+
+@my_app.cli.command('init-db')
+def init_db():
+    # Run the schema bootstrap from the command line, e.g. before starting the server
+    bootstrap_database()
+
+
+@my_app.teardown_appcontext
+def remove_database_sessions(exception=None):
+    # Give the database session of the request back to the connection pool
+    Database.remove_sessions()
 
-base_cleaning_robot = BaseCleaningRobot()
-premium_cleaning_robot = PremiumCleaningRobot()
 
+def dumps(payload):
+    # Serialize the payload to compact JSON bytes, with orjson when it is installed
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
 
-def check_file_size(file):
+
+def json_response(payload, status=200):
+    # Serialize the payload exactly once
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def stream_cleaning_report(robot):
+    # Stream the cleaned tiles array while the robot cleans, followed by the status and error trailer
+    report = CleaningReport.build([], status="completed")
+    yield b'{"report":{"cleaned_tiles":['
+    separator = b''
+    try:
+        for tiles in robot.clean_stream(report):
+            yield separator + dumps(tiles)[1:-1]
+            separator = b','
+    except Exception as e:
+        # The response status is already sent, so the failure is reported in the trailer of the JSON body
+        my_app.logger.error(f"Cleaning report stream failed: {e}")
+        report.status = "error"
+        report.error = str(e)
+    yield b'],"status":' + dumps(report.status) + b',"error":' + dumps(report.error) + b'}}'
+
+
+def check_file_size(file, max_file_size=MAX_FILE_SIZE):
     # Check file size
     file.seek(0, os.SEEK_END)
     file_size = file.tell()
     file.seek(0)
-    if file_size > MAX_FILE_SIZE:
-        raise ValueError('File is too large (max 5MB)')
+    if file_size > max_file_size:
+        raise ValueError(f'File is too large (max {max_file_size // (1024 * 1024)}MB)')
 
 
-def set_robot_map(robot, file):
-    try:
-        check_file_size(file)
-        robot.map = Map.load(file)
+def load_map(file):
+    if map_store is not None:
+        # Store the map on disk and memory-map it, the store enforces its own size limit
+        return map_store.load(file)
+    check_file_size(file)
+    # Reuse the parsed map when the same file was already uploaded
+    return map_cache.load(file)
+
+
+def assign_robot_map(registered_robot, map):
+    with registered_robot.lock:
+        robot = registered_robot.robot
+        robot.map = map
         if isinstance(robot, PremiumCleaningRobot):
             robot.reset_cleaned_tiles()  # Only reset for premium robot
+
+
+def set_robot_map(registered_robot, file):
+    try:
+        # Parse the map before locking the robot, so that its other requests are not blocked meanwhile
+        assign_robot_map(registered_robot, load_map(file))
         return jsonify({'message': 'Map uploaded successfully!'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -56,16 +155,52 @@ def set_map_premium():
     return set_robot_map(premium_cleaning_robot, file)
 
 
-def process_cleaning_request(robot, file):
-    if robot.map is None:
+def get_report_format():
+    # Read the requested report format, defaulting to the full list of cleaned tiles
+    report_format = request.args.get('format', 'full')
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"Unsupported report format: {report_format}. "
+                         f"Supported formats are: {', '.join(REPORT_FORMATS)}.")
+    return report_format
+
+
+def prepare_cleaning_request(robot, path, database_conn):
+    robot.path = path
+    robot.database_conn = database_conn
+
+
+def stream_locked_cleaning_report(registered_robot, path, database_conn):
+    # Hold the robot lock while it cleans, which only starts once the response is being sent
+    with registered_robot.lock:
+        prepare_cleaning_request(registered_robot.robot, path, database_conn)
+        yield from stream_cleaning_report(registered_robot.robot)
+
+
+def max_actions_file_size(file):
+    # Only TXT actions are read one line at a time when streamed, JSON actions are always decoded at once
+    if robot_path_config.stream and file.filename.endswith('.txt'):
+        return robot_path_config.max_stream_file_size
+    return MAX_FILE_SIZE
+
+
+def process_cleaning_request(registered_robot, file, report_format='full'):
+    check_file_size(file, max_actions_file_size(file))
+    if registered_robot.robot.map is None:
         raise ValueError('No map loaded: a map must be loaded before cleaning.')
     # Determine database connection
-    database_conn = current_app.config['DATABASE'] if current_app.config['TESTING'] else Database.connect()
-    # Load the robot path
-    robot.path = RobotPath.load(file)
-    robot.database_conn = database_conn
-    # Return the cleaning session report
-    return json.loads(robot.clean())
+    database_conn = get_database()
+    # Load the robot path, or only its starting position when the actions are parsed while the robot follows them
+    path = RobotPath.stream(file) if robot_path_config.stream else RobotPath.load(file)
+    if report_format == 'stream':
+        # Send the report with chunked transfer while the robot cleans
+        return Response(stream_with_context(stream_locked_cleaning_report(registered_robot, path, database_conn)),
+                        status=200, mimetype='application/json')
+    # Return the cleaning session report, or only its metrics
+    with registered_robot.lock:
+        prepare_cleaning_request(registered_robot.robot, path, database_conn)
+        cleaning_session_report = registered_robot.robot.clean_report(report_format)
+    key = 'metrics' if report_format == 'metrics' else 'report'
+    return json_response({key: cleaning_session_report.to_dict()}, 200)
 
 
 @my_app.route('/clean', methods=['POST'])
@@ -75,10 +210,13 @@ def clean():
 
     file = request.files['file']
     try:
-        check_file_size(file)
+        report_format = get_report_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
         # Use the helper function to process the cleaning request
-        cleaning_session_report = process_cleaning_request(base_cleaning_robot, file)
-        return jsonify({'report': cleaning_session_report}), 200
+        return process_cleaning_request(base_cleaning_robot, file, report_format)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -90,22 +228,146 @@ def clean_premium():
 
     file = request.files['file']
     try:
-        check_file_size(file)
+        report_format = get_report_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
         # Use the helper function to process the cleaning request
-        cleaning_session_report = process_cleaning_request(premium_cleaning_robot, file)
-        return jsonify({'report': cleaning_session_report}), 200
+        return process_cleaning_request(premium_cleaning_robot, file, report_format)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def process_batch_cleaning_request(registered_robot, files, report_format='full'):
+    if len(files) > MAX_BATCH_SIZE:
+        raise ValueError(f'Too many actions files in the batch (max {MAX_BATCH_SIZE})')
+    if registered_robot.robot.map is None:
+        raise ValueError('No map loaded: a map must be loaded before cleaning.')
+    # Determine database connection
+    database_conn = get_database()
+    # Load every path before cleaning, so that an invalid file does not leave a partial batch
+    paths = []
+    for file in files:
+        check_file_size(file)
+        try:
+            paths.append(RobotPath.load(file))
+        except ValueError as e:
+            raise ValueError(f"{file.filename}: {e}")
+
+    # Persist the sessions in a single transaction unless only the reports are requested
+    store = request.args.get('persist', 'true').lower() != 'false'
+    with registered_robot.lock:
+        registered_robot.robot.database_conn = database_conn
+        # Independent sessions are simulated in parallel by the pool, when it is enabled
+        reports = registered_robot.robot.clean_batch(paths, store=store, pool=simulation_pool,
+                                                     report_format=report_format)
+    key = 'metrics' if report_format == 'metrics' else 'reports'
+    return json_response({key: [report.to_dict() for report in reports]}, 200)
+
+
+def clean_batch_endpoint(registered_robot):
+    files = request.files.getlist('file')
+    if not files:
+        return jsonify({'error': 'No actions file uploaded'}), 400
+
+    try:
+        report_format = get_report_format()
+        if report_format == 'stream':
+            raise ValueError("Unsupported report format: stream. Batch reports are returned at once.")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        return process_batch_cleaning_request(registered_robot, files, report_format)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@my_app.route('/clean-batch', methods=['POST'])
+def clean_batch():
+    return clean_batch_endpoint(base_cleaning_robot)
+
+
+@my_app.route('/clean-batch-premium', methods=['POST'])
+def clean_batch_premium():
+    return clean_batch_endpoint(premium_cleaning_robot)
+
+
+@my_app.route('/robots/<robot_id>/set-map', methods=['POST'])
+def set_registered_robot_map(robot_id):
+    if 'file' not in request.files:
+        return jsonify({'error': 'No map file uploaded'}), 400
+
+    file = request.files['file']
+    # Without a type, a registered robot keeps its type and a new robot is a base robot
+    robot_type = request.args.get('type')
+    try:
+        if robot_type is not None:
+            check_robot_type(robot_type)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # Load the map first, so that a failed upload leaves the registry unchanged
+        map = load_map(file)
+        # Create the robot on its first map, or replace it when another type is requested
+        assign_robot_map(robot_registry.get_or_create(robot_id, robot_type, map), map)
+        return jsonify({'message': 'Map uploaded successfully!'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@my_app.route('/robots/<robot_id>/clean', methods=['POST'])
+def clean_registered_robot(robot_id):
+    if 'file' not in request.files:
+        return jsonify({'error': 'No actions file uploaded'}), 400
+
+    file = request.files['file']
+    try:
+        report_format = get_report_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    registered_robot = robot_registry.get(robot_id)
+    if registered_robot is None:
+        return jsonify({'error': f"Unknown robot: {robot_id}. A map must be loaded to create it."}), 404
+
+    try:
+        return process_cleaning_request(registered_robot, file, report_format)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@my_app.route('/robots/<robot_id>/clean-batch', methods=['POST'])
+def clean_batch_registered_robot(robot_id):
+    registered_robot = robot_registry.get(robot_id)
+    if registered_robot is None:
+        return jsonify({'error': f"Unknown robot: {robot_id}. A map must be loaded to create it."}), 404
+    return clean_batch_endpoint(registered_robot)
+
+
+@my_app.route('/robots/<robot_id>', methods=['DELETE'])
+def remove_registered_robot(robot_id):
+    if not robot_registry.remove(robot_id):
+        return jsonify({'error': f"Unknown robot: {robot_id}."}), 404
+    return jsonify({'message': 'Robot removed successfully!'}), 200
+
+
 @my_app.route('/history', methods=['GET'])
 def history():
     try:
-        database_conn = current_app.config['DATABASE'] if current_app.config['TESTING'] else Database.connect()
-        history = database_conn.get_history()
-        # Return the CSV as a downloadable response
+        # Read the optional time range, final state and pagination filters
+        filters = HistoryFilter(**request.args.to_dict())
+    except ValidationError as e:
+        return jsonify({'error': f"Invalid history filters: {e}"}), 400
+
+    try:
+        database_conn = get_database()
+        history = database_conn.iter_history(filters)
+        # Stream the CSV as a downloadable response
         return Response(
-            history,
+            stream_with_context(history),
             mimetype='text/csv',
             headers={'Content-Disposition': 'attachment;filename=history.csv'}
         )
@@ -113,5 +375,27 @@ def history():
         return jsonify({'error': str(e)}), 500
 
 
+@my_app.route('/history/stats', methods=['GET'])
+def history_stats():
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in STATS_BUCKETS:
+        return jsonify({'error': f"Unsupported statistics bucket: {bucket}. "
+                                 f"Supported buckets are: {', '.join(STATS_BUCKETS)}."}), 400
+    try:
+        # Read the optional time range and final state filters
+        filters = HistoryFilter(**{name: value for name, value in request.args.items() if name != 'bucket'})
+    except ValidationError as e:
+        return jsonify({'error': f"Invalid history filters: {e}"}), 400
+    if filters.after_id is not None or filters.limit is not None:
+        return jsonify({'error': "Invalid history filters: the statistics are not paginated."}), 400
+
+    try:
+        database_conn = get_database()
+        return json_response(database_conn.get_stats(filters, bucket), 200)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 if __name__ == '__main__':
+    bootstrap_database()
     my_app.run(debug=False)
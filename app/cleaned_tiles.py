@@ -0,0 +1,48 @@
+from typing import Iterator, List, Tuple
+
+
+class CleanedTiles:
+    """
+    Insertion-ordered set of cleaned tiles, backed by a bitmap sized to the map that stores one flag byte per tile
+    and an append-only log of the tiles in the order they were cleaned.
+    """
+
+    def __init__(self, rows: int = 0, cols: int = 0):
+        self.rows = rows
+        self.cols = cols
+        self._bitmap = bytearray(rows * cols)
+        self._tiles: List[Tuple[int, int]] = []
+
+    def add(self, tile: Tuple[int, int]) -> bool:
+        """Marks a tile of the map as cleaned. Returns False if the tile was already cleaned."""
+        x, y = tile
+        index = y * self.cols + x
+        if self._bitmap[index]:
+            return False
+        self._bitmap[index] = 1
+        self._tiles.append(tile)
+        return True
+
+    def extend(self, tiles: List[Tuple[int, int]]):
+        """Appends tiles already marked in the bitmap to the cleaned tiles, in the order they were cleaned."""
+        self._tiles.extend(tiles)
+
+    @property
+    def bitmap(self) -> bytearray:
+        """Row-major flag byte of each tile of the map: 1 if the tile is cleaned, 0 otherwise."""
+        return self._bitmap
+
+    @property
+    def tiles(self) -> List[Tuple[int, int]]:
+        """Cleaned tiles in the order they were cleaned."""
+        return self._tiles
+
+    def __contains__(self, tile: Tuple[int, int]) -> bool:
+        x, y = tile
+        return 0 <= x < self.cols and 0 <= y < self.rows and self._bitmap[y * self.cols + x] == 1
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return iter(self._tiles)
+
+    def __len__(self) -> int:
+        return len(self._tiles)
@@ -1,13 +1,35 @@
 import csv
 import io
-import json
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, ClassVar, Iterator, List, Literal, Optional, Tuple, Union
 from datetime import datetime
 from pydantic import Field, BaseModel
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from abc import ABC, abstractmethod
+from app import numpy_engine
+from app.cleaned_tiles import CleanedTiles
 from app.database import Database, CleaningSession
 from app.map import Map
-from app.robot_path import RobotPath
+from app.report import CleaningMetrics, CleaningReport, CompactCleaningReport, RunEncoder
+from app.robot_path import RobotPath, RobotPathStream, CODE_DELTAS, DIRECTION_DELTAS
+
+if TYPE_CHECKING:
+    from app.simulation_pool import SimulationPool
+
+# Flag byte of a visited tile in the bitmaps of the metrics-only sessions
+_VISITED = b'\x01'
+# Translation inverting the flag bytes of a bitmap
+_NOT_FLAGGED = bytes([1, 0]) + bytes(254)
+
+# Simulation engines following the robot path: one step segment at a time in Python, or whole blocks with NumPy
+ENGINES = ("python", "numpy")
+
+
+class CleaningRobotConfig(BaseSettings):
+    """Cleaning robot configuration"""
+    model_config = SettingsConfigDict(env_prefix='CLEANING_ROBOT_')
+
+    engine: Literal["python", "numpy"] = Field(default="python", description="Simulation engine following the "
+                                                                             "robot path")
 
 
 class CleaningRobot(BaseModel, ABC):
@@ -15,12 +37,16 @@ class CleaningRobot(BaseModel, ABC):
     Abstract class tha define the interface of the cleaning robot.
     """
     _map: Optional[Map] = None
-    _path: Optional[RobotPath] = None
+    _path: Optional[Union[RobotPath, RobotPathStream]] = None
     _database_conn: Optional[Database] = None
-    _cleaned_tiles: List[tuple] = []
-
-    def __init__(self, map: Optional[Map] = None, path: Optional[RobotPath] = None,
-                 database_conn: Optional[Database] = None):
+    _engine: str = "python"
+    # Whether a cleaning session does not depend on the previous ones, so that sessions can run in any process
+    independent_sessions: ClassVar[bool] = False
+    # Sessions collected by clean_batch() instead of being stored one at a time
+    _batch_sessions: Optional[List[CleaningSession]] = None
+
+    def __init__(self, map: Optional[Map] = None, path: Optional[Union[RobotPath, RobotPathStream]] = None,
+                 database_conn: Optional[Database] = None, engine: str = "python"):
         super().__init__(map=map, path=path, database_conn=database_conn)
         if map is not None:
             self.map = map
@@ -28,6 +54,7 @@ class CleaningRobot(BaseModel, ABC):
             self.path = path
         if database_conn is not None:
             self.database_conn = database_conn
+        self.engine = engine
 
     @property
     def map(self) -> Optional[Map]:
@@ -40,13 +67,13 @@ class CleaningRobot(BaseModel, ABC):
         self._map = map
 
     @property
-    def path(self) -> Optional[RobotPath]:
+    def path(self) -> Optional[Union[RobotPath, RobotPathStream]]:
         return self._path
 
     @path.setter
-    def path(self, path: RobotPath):
-        if not isinstance(path, RobotPath):
-            raise ValueError('The path must be of type RobotPath.')
+    def path(self, path: Union[RobotPath, RobotPathStream]):
+        if not isinstance(path, (RobotPath, RobotPathStream)):
+            raise ValueError('The path must be of type RobotPath or RobotPathStream.')
         self._path = path
 
     @property
@@ -59,18 +86,29 @@ class CleaningRobot(BaseModel, ABC):
             raise ValueError('The database_conn must be of type Database.')
         self._database_conn = database_conn
 
+    @property
+    def engine(self) -> str:
+        return self._engine
+
+    @engine.setter
+    def engine(self, engine: str):
+        if engine not in ENGINES:
+            raise ValueError(f"Unsupported simulation engine: {engine}. Supported engines are: {', '.join(ENGINES)}.")
+        if engine == "numpy" and numpy_engine.np is None:
+            raise ValueError('The numpy simulation engine requires NumPy to be installed.')
+        self._engine = engine
+
     def move(self, x, y, action):
         """Moves the robot according to the given action and returns the new coordinates.
         Raises exceptions if the move is out of bounds or if the tile is not walkable."""
         # Move the robot based on the action direction
-        if action.direction == "north":
-            y -= 1
-        elif action.direction == "south":
-            y += 1
-        elif action.direction == "west":
-            x -= 1
-        elif action.direction == "east":
-            x += 1
+        return self._step(x, y, *DIRECTION_DELTAS[action.direction])
+
+    def _step(self, x, y, dx, dy):
+        """Moves the robot one step along the unit direction (dx, dy) and returns the new coordinates.
+        Raises exceptions if the move is out of bounds or if the tile is not walkable."""
+        x += dx
+        y += dy
 
         # Check if the new position is within bounds
         if not (0 <= x < self.map.cols and 0 <= y < self.map.rows):
@@ -82,113 +120,355 @@ class CleaningRobot(BaseModel, ABC):
 
         return x, y
 
-    def _store_session(self, report: Dict[str, any], start_time: datetime, performed_actions: int):
+    def _follow_path(self, x, y):
+        """Follows the path from (x, y) one whole action at a time and yields the list of tiles visited by each action.
+        Raises the same exceptions as move() at the first step that is out of bounds or not walkable."""
+        for x, y, dx, dy, steps in self._follow_segments(x, y):
+            yield [(x + dx * i, y + dy * i) for i in range(1, steps + 1)]
+
+    def _follow_segments(self, x, y) -> Iterator[Tuple[int, int, int, int, int]]:
+        """Follows the path from (x, y) one whole action at a time and yields the tile each action starts from,
+        its unit direction and its number of walkable steps, without listing the visited tiles.
+        Raises the same exceptions as move() at the first step that is out of bounds or not walkable."""
+        for code, action_steps in self.path.iter_moves():
+            dx, dy = CODE_DELTAS[code]
+            # Validate the whole action segment at once against the map
+            steps = self.map.walkable_steps(x, y, dx, dy, action_steps)
+            if steps:
+                yield x, y, dx, dy, steps
+                x, y = x + dx * steps, y + dy * steps
+            if steps < action_steps:
+                # The next step is blocked: moving onto it raises the out of bounds or non-walkable tile error
+                self._step(x, y, dx, dy)
+
+    def _visit_path(self, x, y) -> Iterator[Tuple[int, List[tuple]]]:
+        """Follows the path from (x, y) with the engine of the robot, and yields the number of tiles visited
+        by each action, or block of actions, with the ones that were cleaned."""
+        if self.engine == "numpy":
+            for xs, ys in numpy_engine.follow_path(self.map, x, y, self.path, self._step):
+                yield len(xs), self._clean_tile_arrays(xs, ys)
+        else:
+            for visited_tiles in self._follow_path(x, y):
+                yield len(visited_tiles), self._clean_tiles(visited_tiles)
+
+    def _check_start(self, x, y):
+        """Checks that the starting position of the path is a walkable tile of the map."""
+        if not (0 <= x < self.map.cols and 0 <= y < self.map.rows) or not self.map.is_walkable(x, y):
+            raise ValueError(f"Invalid starting position ({x}, {y}).")
+
+    def _store_session(self, report: Union[CleaningReport, CleaningMetrics], start_time: datetime,
+                       performed_actions: int, cleaned_tiles: int):
         """Stores the cleaning session in the database."""
         end_time = datetime.now()
         duration = end_time - start_time
 
         session = CleaningSession(
             session_start_time=start_time,
-            session_final_state=report["status"],
+            session_final_state=report.status,
             number_of_actions=performed_actions,
-            number_of_cleaned_tiles=len(self._cleaned_tiles),
+            number_of_cleaned_tiles=cleaned_tiles,
             duration=duration
         )
-        self.database_conn.create_table()
-        self.database_conn.save_session(session)
-
-    @abstractmethod
-    def clean(self):
+        if self._batch_sessions is not None:
+            # Returned by simulate(), and stored by clean_batch() together with the other sessions of the batch
+            self._batch_sessions.append(session)
+            return
+        self.database_conn.ensure_schema()
+        self.database_conn.submit_session(session)
+
+    def clean(self) -> CleaningReport:
         """
-        Executes the cleaning session by following the defined path, generates a cleaning report in JSON format,
+        Executes the cleaning session by following the defined path, generates a cleaning report,
         and stores the session in the database.
         """
-        pass
+        report = CleaningReport.build([], status="completed")
+        for tiles in self.clean_stream(report):
+            report.cleaned_tiles.extend(tiles)
+        return report
+
+    def clean_metrics(self) -> CleaningMetrics:
+        """
+        Executes the cleaning session like clean(), but only measures it: the visited tiles are marked in a bitmap
+        of the map instead of being listed, so the memory used does not grow with the length of the path.
+        """
+        start_time = datetime.now()
+        x, y = self.path.x, self.path.y
+        map = self.map
+        cols = map.cols
+        visited = bytearray(map.rows * cols)
+        status, error = "completed", None
+        path_length = cleaned_tiles = unique_tiles = 0
+        self._start_session()
+        try:
+            self._check_start(x, y)
 
+            # Mark starting position as visited
+            cleaned_tiles, unique_tiles = self._cover_tiles(visited, slice(y * cols + x, y * cols + x + 1), 1)
 
-class BaseCleaningRobot(CleaningRobot):
-    """
-    Concrete class that implements the base cleaning robot interface.
-    """
+            for x, y, dx, dy, steps in self._follow_segments(x, y):
+                path_length += steps
+                # The tiles of a segment are evenly spaced in the row-major bitmap
+                first, last = (y + dy) * cols + x + dx, (y + dy * steps) * cols + x + dx * steps
+                cleaned, first_visits = self._cover_tiles(
+                    visited, slice(min(first, last), max(first, last) + 1, abs(dy * cols + dx)), steps)
+                cleaned_tiles += cleaned
+                unique_tiles += first_visits
+
+        except ValueError as e:
+            status, error = "error", str(e)
+
+        # Every step but the ones onto a new tile is a revisit, the starting tile being visited without a step
+        walkable_tiles = map.walkable_tiles
+        metrics = CleaningMetrics(cleaned_tiles=cleaned_tiles, unique_tiles=unique_tiles,
+                                  revisits=path_length + min(unique_tiles, 1) - unique_tiles,
+                                  coverage=100 * unique_tiles / walkable_tiles if walkable_tiles else 0.0,
+                                  path_length=path_length, status=status, error=error)
+        self._store_session(metrics, start_time, path_length, cleaned_tiles)
+        return metrics
+
+    def _cover_tiles(self, visited: bytearray, tiles: slice, count: int) -> Tuple[int, int]:
+        """Cleans the given count of tiles of the bitmap slice and marks them as visited. Returns how many were
+        cleaned and how many were visited for the first time."""
+        first_visits = visited[tiles].count(0)
+        visited[tiles] = _VISITED * count
+        return self._count_cleaned_tiles(tiles, count), first_visits
+
+    def clean_compact(self) -> CompactCleaningReport:
+        """
+        Executes the cleaning session like clean(), but returns the cleaned tiles as runs encoded from the segments
+        of the path, so that the report of a robot cleaning every visited tile is built in the number of actions
+        rather than the number of steps.
+        """
+        start_time = datetime.now()
+        x, y = self.path.x, self.path.y
+        encoder = RunEncoder()
+        status, error = "completed", None
+        performed_actions = cleaned_tiles = 0
+        self._start_session()
+        try:
+            self._check_start(x, y)
 
-    def clean(self):
-        """Executes the cleaning session by following the defined path, generates a cleaning report in JSON format,
-        and stores the session in the database."""
+            # Mark starting position as cleaned
+            for tile in self._clean_tiles([(x, y)]):
+                encoder.add(*tile)
+                cleaned_tiles += 1
+
+            for x, y, dx, dy, steps in self._follow_segments(x, y):
+                performed_actions += steps
+                cleaned_tiles += self._encode_cleaned_segment(encoder, x, y, dx, dy, steps)
+
+        except ValueError as e:
+            status, error = "error", str(e)
+
+        report = CompactCleaningReport.model_construct(cleaned_runs=encoder.runs, status=status, error=error)
+        self._store_session(report, start_time, performed_actions, cleaned_tiles)
+        return report
+
+    def clean_report(self, report_format: str = "full") -> Union[CleaningReport, CompactCleaningReport,
+                                                                 CleaningMetrics]:
+        """Executes the cleaning session and returns its report in the given format: the full report, the compact
+        report or only the metrics of the session."""
+        if report_format == "compact":
+            return self.clean_compact()
+        if report_format == "metrics":
+            return self.clean_metrics()
+        return self.clean()
+
+    def clean_batch(self, paths: List[Union[RobotPath, RobotPathStream]], store: bool = True,
+                    pool: Optional["SimulationPool"] = None,
+                    report_format: str = "full") -> List[Union[CleaningReport, CompactCleaningReport,
+                                                               CleaningMetrics]]:
+        """
+        Executes one cleaning session per path, in order, exactly as consecutive calls to clean() would,
+        and stores all the sessions in the database in a single transaction, or none of them if store is False.
+        When the sessions of the robot are independent, they can be simulated in parallel by a pool of processes.
+        The reports are returned in the given format, as with clean_report().
+        """
+        if pool is not None and self.independent_sessions and pool.accepts(len(paths)):
+            results = pool.simulate(self.map, paths, report_format)
+        else:
+            results = self.simulate(paths, report_format)
+        reports = [report for report, _ in results]
+        sessions = [session for _, session in results]
+
+        if store and sessions:
+            self.database_conn.ensure_schema()
+            self.database_conn.save_sessions(sessions)
+        return reports
+
+    def simulate(self, paths: List[Union[RobotPath, RobotPathStream]], report_format: str = "full") \
+            -> List[Tuple[Union[CleaningReport, CompactCleaningReport, CleaningMetrics], CleaningSession]]:
+        """Executes one cleaning session per path, in order, and returns their reports in the given format
+        with their unsaved sessions."""
+        reports = []
+        self._batch_sessions = []
+        try:
+            for path in paths:
+                self.path = path
+                reports.append(self.clean_report(report_format))
+            return list(zip(reports, self._batch_sessions))
+        finally:
+            self._batch_sessions = None
+
+    def clean_stream(self, report: CleaningReport) -> Iterator[List[tuple]]:
+        """
+        Executes the cleaning session by following the defined path and yields the tiles cleaned by each action
+        as soon as they are cleaned, without keeping them. When the session ends, sets the final status and error
+        of the given report and stores the session in the database, including when the tiles stop being consumed
+        before the end of the path.
+        """
         start_time = datetime.now()
         x, y = self.path.x, self.path.y
         performed_actions = 0
+        cleaned_tiles = 0
+        self._start_session()
         try:
-            # Check if the starting position is valid
-            if not (0 <= x < self.map.cols and 0 <= y < self.map.rows) or not self.map.is_walkable(x, y):
-                raise ValueError(f"Invalid starting position ({x}, {y}).")
-
-            self._cleaned_tiles.append((x, y))  # Mark starting position as cleaned
-            for action in self.path.actions:
-                for _ in range(action.steps):
-                    # Update the robot's position
-                    x, y = self.move(x, y, action)
-                    self._cleaned_tiles.append((x, y))
-                    performed_actions += 1
+            self._check_start(x, y)
+
+            # Mark starting position as cleaned
+            tiles = self._clean_tiles([(x, y)])
+            cleaned_tiles += len(tiles)
+            if tiles:
+                yield tiles
+
+            for visited, tiles in self._visit_path(x, y):
+                performed_actions += visited
+                cleaned_tiles += len(tiles)
+                if tiles:
+                    yield tiles
 
         except ValueError as e:
-            error_message = str(e)
-            report = {"cleaned_tiles": self._cleaned_tiles, "status": "error", "error": error_message}
-            self._store_session(report, start_time, performed_actions)
-            self._cleaned_tiles = []
-            return json.dumps(report, indent=4)
+            report.status = "error"
+            report.error = str(e)
+        except GeneratorExit:
+            # The consumer closed the stream, e.g. the client disconnected while the report was being sent
+            report.status = "error"
+            report.error = "Cleaning session interrupted before the end of the path."
+            raise
+        except Exception as e:
+            # Any other failure ends the session with an error instead of storing it as completed
+            report.status = "error"
+            report.error = str(e)
+            raise
+        finally:
+            self._store_session(report, start_time, performed_actions, cleaned_tiles)
 
-        report = {"cleaned_tiles": self._cleaned_tiles, "status": "completed", "error": None}
-        self._store_session(report, start_time, performed_actions)
-        self._cleaned_tiles = []
-        return json.dumps(report, indent=4)
+    @abstractmethod
+    def _start_session(self):
+        """Prepares the robot for a new cleaning session."""
+        pass
 
+    @abstractmethod
+    def _clean_tiles(self, tiles: List[tuple]) -> List[tuple]:
+        """Cleans the visited tiles and returns the ones that were actually cleaned, in order."""
+        pass
 
-class PremiumCleaningRobot(CleaningRobot):
-    """
-    Concrete class that implements the premium cleaning robot interface.
-    """
+    @abstractmethod
+    def _clean_tile_arrays(self, xs, ys) -> List[tuple]:
+        """Cleans the visited tiles given as NumPy coordinate arrays and returns the ones that were actually cleaned,
+        in order."""
+        pass
 
-    def clean(self):
-        """Executes the cleaning session by following the defined path, generates a cleaning report in JSON format,
-        and stores the session in the database. Do not clean the tile cleaned in the previous session."""
-        start_time = datetime.now()
-        x, y = self.path.x, self.path.y
-        performed_actions = 0
+    @abstractmethod
+    def _encode_cleaned_segment(self, encoder: RunEncoder, x, y, dx, dy, steps) -> int:
+        """Cleans the tiles reached by the given steps from (x, y) along the unit direction (dx, dy), adds the ones
+        that were actually cleaned to the encoder, in order, and returns how many were cleaned."""
+        pass
 
-        # Make a copy of the cleaned tiles from the previous session to avoid cleaning them again
-        previous_cleaned_tiles = set(self._cleaned_tiles)
-        # Clear the current session cleaned tiles list
-        self._cleaned_tiles = []
+    @abstractmethod
+    def _count_cleaned_tiles(self, tiles: slice, count: int) -> int:
+        """Cleans the given count of visited tiles, given as a slice of the row-major bitmap of the map, and returns
+        how many were actually cleaned."""
+        pass
 
-        try:
-            # Check if the starting position is valid
-            if not (0 <= x < self.map.cols and 0 <= y < self.map.rows) or not self.map.is_walkable(x, y):
-                raise ValueError(f"Invalid starting position ({x}, {y}).")
 
-            # Mark starting position as cleaned if it hasn't been cleaned in the previous session
-            if (x, y) not in previous_cleaned_tiles:
-                self._cleaned_tiles.append((x, y))
+class BaseCleaningRobot(CleaningRobot):
+    """
+    Concrete class that implements the base cleaning robot interface.
+    """
+    independent_sessions: ClassVar[bool] = True
+
+    def _start_session(self):
+        """The base robot does not keep any state between cleaning sessions."""
+        pass
 
-            for action in self.path.actions:
-                for _ in range(action.steps):
-                    # Update the robot's position
-                    x, y = self.move(x, y, action)
+    def _clean_tiles(self, tiles: List[tuple]) -> List[tuple]:
+        """Cleans every visited tile, including the ones already cleaned in the current session."""
+        return tiles
 
-                    # Only clean the tile if it hasn't been cleaned in the previous session
-                    if (x, y) not in previous_cleaned_tiles and (x, y) not in self._cleaned_tiles:
-                        self._cleaned_tiles.append((x, y))
+    def _clean_tile_arrays(self, xs, ys) -> List[tuple]:
+        """Cleans every visited tile, including the ones already cleaned in the current session."""
+        return numpy_engine.to_tiles(xs, ys)
 
-                    performed_actions += 1
+    def _encode_cleaned_segment(self, encoder: RunEncoder, x, y, dx, dy, steps) -> int:
+        """Cleans every visited tile, so the whole segment is encoded at once."""
+        encoder.add_segment(x, y, dx, dy, steps)
+        return steps
+
+    def _count_cleaned_tiles(self, tiles: slice, count: int) -> int:
+        """Cleans every visited tile, including the ones already cleaned in the current session."""
+        return count
 
-        except ValueError as e:
-            error_message = str(e)
-            report = {"cleaned_tiles": self._cleaned_tiles, "status": "error", "error": error_message}
-            self._store_session(report, start_time, performed_actions)
-            return json.dumps(report, indent=4)
 
-        report = {"cleaned_tiles": self._cleaned_tiles, "status": "completed", "error": None}
-        self._store_session(report, start_time, performed_actions)
-        return json.dumps(report, indent=4)
+class PremiumCleaningRobot(CleaningRobot):
+    """
+    Concrete class that implements the premium cleaning robot interface.
+    Do not clean the tiles cleaned in the previous session, nor the ones already cleaned in the current session.
+    """
+    _cleaned_tiles: CleanedTiles = CleanedTiles()
+    _previous_cleaned_tiles: CleanedTiles = CleanedTiles()
+
+    def _start_session(self):
+        """Keeps the cleaned tiles bitmap of the previous session to avoid cleaning them again,
+        and starts an empty cleaned tiles bitmap for the current session."""
+        self._previous_cleaned_tiles = self._cleaned_tiles
+        self._cleaned_tiles = CleanedTiles(self.map.rows, self.map.cols)
+
+    def _clean_tiles(self, tiles: List[tuple]) -> List[tuple]:
+        """Only cleans the tiles that haven't been cleaned in the previous or in the current session."""
+        previous_cleaned_tiles = self._previous_cleaned_tiles
+        cleaned_tiles = self._cleaned_tiles
+        return [tile for tile in tiles if tile not in previous_cleaned_tiles and cleaned_tiles.add(tile)]
+
+    def _clean_tile_arrays(self, xs, ys) -> List[tuple]:
+        """Only cleans the first visit of the tiles that haven't been cleaned in the previous or in the current
+        session."""
+        return numpy_engine.first_visits(xs, ys, self._previous_cleaned_tiles, self._cleaned_tiles)
+
+    def _encode_cleaned_segment(self, encoder: RunEncoder, x, y, dx, dy, steps) -> int:
+        """Only cleans the tiles that haven't been cleaned in the previous or in the current session, which are
+        checked one by one."""
+        tiles = self._clean_tiles([(x + dx * i, y + dy * i) for i in range(1, steps + 1)])
+        for tile in tiles:
+            encoder.add(*tile)
+        return len(tiles)
+
+    def _count_cleaned_tiles(self, tiles: slice, count: int) -> int:
+        """Only cleans the tiles that haven't been cleaned in the previous or in the current session. The tiles are
+        marked in the bitmap of the session without being listed."""
+        cleaned_tiles, previous_cleaned_tiles = self._cleaned_tiles, self._previous_cleaned_tiles
+        bitmap = cleaned_tiles.bitmap
+        previous = previous_cleaned_tiles.bitmap
+        if not previous:
+            # No previous session since the map was set
+            cleaned = bitmap[tiles].count(0)
+            bitmap[tiles] = _VISITED * count
+            return cleaned
+        if (previous_cleaned_tiles.rows, previous_cleaned_tiles.cols) != (cleaned_tiles.rows, cleaned_tiles.cols):
+            # The previous session was on a map of another size, so its tiles are looked up by their coordinates
+            cols = cleaned_tiles.cols
+            cleaned = 0
+            for index in range(*tiles.indices(len(bitmap))):
+                if not bitmap[index] and (index % cols, index // cols) not in previous_cleaned_tiles:
+                    bitmap[index] = 1
+                    cleaned += 1
+            return cleaned
+        # A tile is cleaned unless it is flagged in either bitmap
+        flagged = int.from_bytes(bitmap[tiles], 'little') | int.from_bytes(previous[tiles], 'little')
+        cleaned = flagged.to_bytes(count, 'little').count(0)
+        # Every tile of the slice is now visited, so the cleaned ones are the tiles not cleaned in the previous session
+        bitmap[tiles] = previous[tiles].translate(_NOT_FLAGGED)
+        return cleaned
 
     def reset_cleaned_tiles(self):
-        self._cleaned_tiles = []
+        self._cleaned_tiles = CleanedTiles()
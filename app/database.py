@@ -1,19 +1,27 @@
+import atexit
 import csv
 import io
+import logging
+import queue
+import time
 from abc import ABC
-from threading import Lock
-from typing import ClassVar, Union
+from threading import Lock, Thread
+from datetime import datetime
+from typing import ClassVar, List, Optional, Union
 
 from pydantic import BaseModel, Field, ConfigDict
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Interval, make_url, inspect
+from sqlalchemy import (create_engine, Column, Integer, String, DateTime, Interval, Index, make_url, inspect, select,
+                        func)
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm.session import Session
+from sqlalchemy.orm import sessionmaker, scoped_session
 
 # Base class for ORM models
 Base = declarative_base()
 
+logger = logging.getLogger(__name__)
+
 
 class TestDatabaseConfig(BaseSettings):
     """Test database configuration"""
@@ -24,6 +32,10 @@ class TestDatabaseConfig(BaseSettings):
     user: str = Field(default="test", description="The username for authenticating to the database.")
     password: str = Field(default="test", description="The password for the database user.")
     dbname: str = Field(default="test", description="The name of the database to connect to.")
+    pool_size: int = Field(default=5, gt=0, description="Number of connections kept open in the connection pool.")
+    max_overflow: int = Field(default=10, ge=0, description="Number of connections allowed beyond the pool size.")
+    pool_timeout: int = Field(default=30, gt=0, description="Seconds to wait for a connection from the pool.")
+    pool_pre_ping: bool = Field(default=True, description="Test pooled connections for liveness before using them.")
 
     @property
     def db_url(self) -> str:
@@ -40,6 +52,10 @@ class ProdDatabaseConfig(BaseSettings):
     user: str = Field(default="user", description="The username for authenticating to the database.")
     password: str = Field(default="root", description="The password for the database user.")
     dbname: str = Field(default="postgres", description="The name of the database to connect to.")
+    pool_size: int = Field(default=5, gt=0, description="Number of connections kept open in the connection pool.")
+    max_overflow: int = Field(default=10, ge=0, description="Number of connections allowed beyond the pool size.")
+    pool_timeout: int = Field(default=30, gt=0, description="Seconds to wait for a connection from the pool.")
+    pool_pre_ping: bool = Field(default=True, description="Test pooled connections for liveness before using them.")
 
     @property
     def db_url(self) -> str:
@@ -47,6 +63,20 @@ class ProdDatabaseConfig(BaseSettings):
         return f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.dbname}"
 
 
+class WriteBehindConfig(BaseSettings):
+    """Write-behind persistence configuration"""
+    model_config = SettingsConfigDict(env_prefix='WRITE_BEHIND_')
+
+    enabled: bool = Field(default=False, description="Queue cleaning sessions and save them from a background thread.")
+    queue_size: int = Field(default=10000, gt=0, description="Maximum number of cleaning sessions waiting to be saved.")
+    batch_size: int = Field(default=500, gt=0, description="Maximum number of cleaning sessions saved per transaction.")
+    flush_interval: float = Field(default=0.5, gt=0, description="Maximum seconds a session waits in the queue "
+                                                                 "for its batch to fill up.")
+    put_timeout: float = Field(default=1.0, ge=0, description="Seconds a request waits when the queue is full "
+                                                             "before saving its session synchronously.")
+    max_retries: int = Field(default=3, ge=0, description="Number of retries of a batch that could not be saved.")
+
+
 class CleaningSession(Base):
     """ ORM model for the CleaningSessions table. """
     __tablename__ = 'CleaningSessions'
@@ -58,16 +88,70 @@ class CleaningSession(Base):
     number_of_cleaned_tiles = Column(Integer, nullable=False)
     duration = Column(Interval, nullable=False)
 
+    __table_args__ = (
+        # Time range scans over the history
+        Index('ix_cleaning_sessions_start_time', 'session_start_time'),
+        # Time range scans over the sessions that ended in a given state, e.g. the last hour of errors
+        Index('ix_cleaning_sessions_final_state_start_time', 'session_final_state', 'session_start_time'),
+    )
+
+
+# Time buckets of the cleaning history statistics
+STATS_BUCKETS = ("hour", "day", "week", "month")
+
+
+class HistoryFilter(BaseModel):
+    """Filters and keyset pagination of the cleaning history."""
+    # Unknown filters are rejected rather than ignored, which would silently return the whole history
+    model_config = ConfigDict(extra='forbid')
+
+    start: Optional[datetime] = Field(None, description="Only sessions started at or after this time")
+    end: Optional[datetime] = Field(None, description="Only sessions started before this time")
+    state: Optional[str] = Field(None, description="Only sessions that ended in this state")
+    after_id: Optional[int] = Field(None, ge=0, description="Only sessions after this id, to fetch the next page")
+    limit: Optional[int] = Field(None, gt=0, description="Maximum number of sessions to return")
+
+    def is_empty(self) -> bool:
+        """Whether no filter is set, i.e. the whole history is requested."""
+        return all(value is None for value in self.model_dump().values())
+
+    def where(self, query):
+        """Add the time range and final state filters to a query over the Cleaning Sessions table."""
+        if self.start is not None:
+            query = query.where(CleaningSession.session_start_time >= self.start)
+        if self.end is not None:
+            query = query.where(CleaningSession.session_start_time < self.end)
+        if self.state is not None:
+            query = query.where(CleaningSession.session_final_state == self.state)
+        return query
+
+    def apply(self, query):
+        """Add the filters and the keyset pagination, ordering by id, to a query over the Cleaning Sessions table."""
+        query = self.where(query)
+        if self.after_id is not None:
+            query = query.where(CleaningSession.id > self.after_id)
+        query = query.order_by(CleaningSession.id)
+        if self.limit is not None:
+            query = query.limit(self.limit)
+        return query
+
 
 class Database(BaseModel):
     """ Database class for managing the database connection. """
     config: Union[ProdDatabaseConfig, TestDatabaseConfig] = Field(..., description="Database configuration", frozen=True)
-    session: Session = Field(..., description="Database session", frozen=True)
+    engine: Engine = Field(..., description="Database engine holding the connection pool", frozen=True)
+    session: scoped_session = Field(..., description="Database session, scoped to the current thread", frozen=True)
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     # Singleton pattern: only one database connection per configuration
     _instances: ClassVar = {}
+    # Whether the Cleaning Sessions table is known to exist, so that the schema is not checked on every request
+    _schema_ready: bool = False
+    # Background writer of the cleaning sessions, when write-behind persistence is enabled
+    _writer: Optional["SessionWriter"] = None
+    # Serializes starting and stopping the writer, so that concurrent first requests start a single one
+    _writer_lock: ClassVar[Lock] = Lock()
 
     def __new__(cls, config: Union[ProdDatabaseConfig, TestDatabaseConfig]):
         config_hash = hash(config.db_url)  # Use db_url as the unique key for the config
@@ -77,15 +161,24 @@ class Database(BaseModel):
         return cls._instances[config_hash]
 
     def __init__(self, config: Union[ProdDatabaseConfig, TestDatabaseConfig]):
+        # The singleton instance is initialized only once, so that its connection pool is shared
+        if 'engine' in self.__dict__:
+            return
         try:
-            # Use the db_url property of DatabaseConfig to construct the engine
-            engine = create_engine(config.db_url)
+            # Use the db_url property of DatabaseConfig to construct the engine and its connection pool
+            engine = create_engine(
+                config.db_url,
+                pool_size=config.pool_size,
+                max_overflow=config.max_overflow,
+                pool_timeout=config.pool_timeout,
+                pool_pre_ping=config.pool_pre_ping
+            )
             # Create session factory
             session_factory = sessionmaker(bind=engine)
-            # Create a session
-            session = session_factory()
+            # Give each thread its own session
+            session = scoped_session(session_factory)
             # Return a new instance with the session
-            super().__init__(config=config, session=session)
+            super().__init__(config=config, engine=engine, session=session)
         except Exception as e:
             raise Exception(f"Error connecting to database: {e}")
 
@@ -101,43 +194,131 @@ class Database(BaseModel):
         """Create the Cleaning Sessions table if it does not exist."""
         try:
             # Create all tables (if not already created)
-            Base.metadata.create_all(self.session.bind)
+            Base.metadata.create_all(self.engine)
+            # Add the indexes missing from a table created by an earlier version
+            for index in CleaningSession.__table__.indexes:
+                index.create(self.engine, checkfirst=True)
+            self._schema_ready = True
         except Exception as e:
             raise Exception(f"Error creating table: {e}")
 
+    def ensure_schema(self):
+        """Create the database schema the first time it is needed, then only check the cached schema state."""
+        if not self._schema_ready:
+            self.create_table()
+
+    def __check_history_table(self):
+        """Raise an exception if the Cleaning Sessions table does not exist."""
+        if not self._schema_ready:
+            inspector = inspect(self.engine)
+            if CleaningSession.__tablename__ not in inspector.get_table_names():
+                raise Exception("There are no past cleaning sessions in the database. "
+                                "Start a cleaning session to begin tracking your cleaning history.")
+            self._schema_ready = True
+
     def get_history(self):
         """
         Retrieve all the rows from the Cleaning Sessions table and
-        write to a CSV file in the current directory.
+        return them as CSV content.
         """
+        return ''.join(self.iter_history())
+
+    def iter_history(self, filters: Optional[HistoryFilter] = None, chunk_size: int = 1000):
+        """
+        Retrieve the rows of the Cleaning Sessions table matching the filters through a server-side cursor and
+        return an iterator over the CSV content, producing one chunk of rows at a time.
+        """
+        filters = filters or HistoryFilter()
         try:
-            # Check if the table exists
-            inspector = inspect(self.session.bind)
-            if CleaningSession.__tablename__ not in inspector.get_table_names():
-                raise Exception("There are no past cleaning sessions in the database. "
-                                "Start a cleaning session to begin tracking your cleaning history.")
+            # Check if the table exists, unless the schema is already known to be ready
+            self.__check_history_table()
 
-            # Retrieve all rows
-            history = self.session.query(CleaningSession).all()
-            if not history:
+            # Select only the table columns, fetching chunk_size rows at a time from the cursor
+            columns = CleaningSession.__table__.columns
+            query = filters.apply(select(*columns))
+            result = self.session.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+            chunks = result.partitions()
+            first_chunk = next(chunks, None)
+            # An empty page of a filtered history is not an error
+            if not first_chunk and filters.is_empty():
+                result.close()
                 raise Exception("There are no past cleaning sessions in the database. "
                                 "Start a cleaning session to begin tracking your cleaning history.")
-            csv_buffer = io.StringIO()
-            writer = csv.writer(csv_buffer)
+        except Exception as e:
+            raise Exception(f"Error fetching history: {e}")
+
+        return self.__write_history_csv(result, [column.name for column in columns], first_chunk, chunks)
+
+    @staticmethod
+    def __write_history_csv(result, header, first_chunk, chunks):
+        """Write the header and the rows of the history as CSV, yielding the content of each chunk of rows."""
+        csv_buffer = io.StringIO()
+        writer = csv.writer(csv_buffer)
+        try:
             # Write the header (column names)
-            writer.writerow([column.name for column in CleaningSession.__table__.columns])
-            # Write the rows of the history
-            for session in history:
-                writer.writerow([
-                    int(getattr(session, column.name)) if isinstance(getattr(session, column.name), (int, float))
-                    else getattr(session, column.name) for column in CleaningSession.__table__.columns
-                ])
-            csv_content = csv_buffer.getvalue()
+            writer.writerow(header)
+            chunk = first_chunk
+            if not chunk:
+                yield csv_buffer.getvalue()
+            while chunk:
+                # Write the rows of the chunk
+                writer.writerows(
+                    [int(value) if isinstance(value, (int, float)) else value for value in row] for row in chunk
+                )
+                yield csv_buffer.getvalue()
+                csv_buffer.seek(0)
+                csv_buffer.truncate()
+                chunk = next(chunks, None)
+        finally:
+            result.close()
             csv_buffer.close()
-            return csv_content
 
+    def get_stats(self, filters: Optional[HistoryFilter] = None, bucket: str = "day"):
+        """
+        Compute aggregate statistics of the cleaning sessions matching the filters, per time bucket:
+        number of sessions, error rate, mean duration and cleaned tiles per action.
+        """
+        if bucket not in STATS_BUCKETS:
+            raise ValueError(f"Unsupported statistics bucket: {bucket}. "
+                             f"Supported buckets are: {', '.join(STATS_BUCKETS)}.")
+        filters = filters or HistoryFilter()
+        try:
+            # Check if the table exists, unless the schema is already known to be ready
+            self.__check_history_table()
+
+            # Aggregate the sessions in the database, grouped by time bucket
+            period = func.date_trunc(bucket, CleaningSession.session_start_time).label('period')
+            query = filters.where(select(
+                period,
+                func.count().label('sessions'),
+                func.count().filter(CleaningSession.session_final_state == 'error').label('errors'),
+                func.sum(func.extract('epoch', CleaningSession.duration)).label('duration'),
+                func.sum(CleaningSession.number_of_actions).label('actions'),
+                func.sum(CleaningSession.number_of_cleaned_tiles).label('cleaned_tiles'),
+            )).group_by(period).order_by(period)
+            rows = self.session.execute(query).all()
         except Exception as e:
-            raise Exception(f"Error fetching history: {e}")
+            raise Exception(f"Error computing history statistics: {e}")
+
+        stats = [self.__session_stats(row.sessions, row.errors, row.duration, row.actions, row.cleaned_tiles,
+                                      period=row.period.isoformat()) for row in rows]
+        totals = self.__session_stats(*(sum(getattr(row, name) for row in rows)
+                                        for name in ('sessions', 'errors', 'duration', 'actions', 'cleaned_tiles')))
+        return {"bucket": bucket, "stats": stats, "totals": totals}
+
+    @staticmethod
+    def __session_stats(sessions, errors, duration, actions, cleaned_tiles, **fields):
+        """Derive the rates and means of a group of cleaning sessions from its sums."""
+        return {
+            **fields,
+            "sessions": sessions,
+            "errors": errors,
+            "error_rate": errors / sessions if sessions else None,
+            "mean_duration": float(duration) / sessions if sessions else None,
+            "actions": actions,
+            "cleaned_tiles": cleaned_tiles,
+            "tiles_per_action": cleaned_tiles / actions if actions else None,
+        }
 
     def save_session(self, session: CleaningSession):
         """Insert a cleaning session into the Cleaning Sessions table."""
@@ -149,23 +330,140 @@ class Database(BaseModel):
             self.session.rollback()
             raise Exception(f"Error saving session: {e}")
 
+    def save_sessions(self, sessions: List[CleaningSession]):
+        """Insert several cleaning sessions into the Cleaning Sessions table in a single transaction."""
+        try:
+            # The batch is sent as multi-row INSERT statements
+            self.session.add_all(sessions)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise Exception(f"Error saving sessions: {e}")
+
+    def submit_session(self, session: CleaningSession):
+        """Store a cleaning session: queue it when write-behind persistence is enabled, otherwise insert it now."""
+        if self._writer is not None:
+            self._writer.submit(session)
+        else:
+            self.save_session(session)
+
+    def enable_write_behind(self, config: WriteBehindConfig):
+        """Start saving the submitted cleaning sessions in batches from a background thread."""
+        # Once the writer is running, every later request returns without taking the lock
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = SessionWriter(self, config)
+
+    def disable_write_behind(self):
+        """Save the queued cleaning sessions and go back to inserting each session when it is submitted."""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+
     def clean(self):
         """Clean the entire Cleaning Sessions table."""
         try:
-            # Create all tables (if not already created)
-            Base.metadata.drop_all(self.session.bind)
+            # Drop all tables
+            Base.metadata.drop_all(self.engine)
+            self._schema_ready = False
         except Exception as e:
             raise Exception(f"Error creating table: {e}")
 
     def close(self):
-        """Close the database session."""
+        """Close the database session of the current thread and return its connection to the pool."""
         try:
             if self.session:
-                self.session.close()
-                Database._instance = None  # Reset instance after closing
+                self.session.remove()
         except Exception as e:
             raise Exception(f"Error closing session: {e}")
 
+    @classmethod
+    def remove_sessions(cls):
+        """Close the session of the current thread for every database connection, e.g. at the end of a request."""
+        for instance in cls._instances.values():
+            if 'session' in instance.__dict__:
+                instance.close()
+
     def __del__(self):
         """Ensure the session is closed when the object is deleted."""
-        self.close()
+        if 'session' in self.__dict__:
+            self.close()
+
+
+class SessionWriter:
+    """
+    Write-behind queue of cleaning sessions. Sessions are buffered in a bounded in-process queue and saved in batches
+    by a background thread. The queue is flushed when the writer is closed, at the latest on interpreter shutdown.
+    """
+    # Marks the end of the queue
+    _STOP = object()
+
+    def __init__(self, database: Database, config: WriteBehindConfig):
+        self.database = database
+        self.config = config
+        self._queue = queue.Queue(maxsize=config.queue_size)
+        self._thread = Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, session: CleaningSession):
+        """Queue a cleaning session. When the queue stays full, save the session synchronously instead."""
+        try:
+            self._queue.put(session, timeout=self.config.put_timeout)
+        except queue.Full:
+            self.database.save_session(session)
+
+    def flush(self):
+        """Wait until every queued cleaning session has been saved."""
+        self._queue.join()
+
+    def close(self):
+        """Save the queued cleaning sessions and stop the background thread."""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        """Save the queued cleaning sessions in batches until the writer is closed."""
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=self.config.flush_interval)
+            except queue.Empty:
+                continue
+            # Collect a batch until it is full or the flush interval has elapsed
+            batch, taken = [], 1
+            deadline = time.monotonic() + self.config.flush_interval
+            while item is not self._STOP:
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.config.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                    taken += 1
+                except queue.Empty:
+                    break
+            else:
+                running = False
+            if batch:
+                self._save(batch)
+            for _ in range(taken):
+                self._queue.task_done()
+        self.database.close()
+
+    def _save(self, batch: List[CleaningSession]):
+        """Save a batch of cleaning sessions, retrying with a growing delay if the database is unavailable."""
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                self.database.save_sessions(batch)
+                return
+            except Exception as e:
+                if attempt == self.config.max_retries:
+                    logger.error(f"Dropping {len(batch)} cleaning sessions: {e}")
+                else:
+                    time.sleep(0.1 * 2 ** attempt)
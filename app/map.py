@@ -1,7 +1,32 @@
 import json
+import re
+import struct
+from array import array
+from bisect import bisect_right
 
-from pydantic import BaseModel, Field, ValidationError, model_validator, validator, field_validator
-from typing import List
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator, validator, field_validator
+from typing import List, Optional, Tuple, Union
+
+# Matches a maximal run of contiguous walkable tiles in a row or column of the grid
+_WALKABLE_RUN = re.compile(b'\x01+')
+
+# Translates the tile characters of a TXT map into grid bytes: 'o' is walkable, 'x' is not
+_TXT_TILES = bytes.maketrans(b'ox', b'\x01\x00')
+
+# Header of a binary map: magic, version, grid encoding, rows and cols, little-endian
+_BIN_HEADER = struct.Struct('<4sBBII')
+_BIN_MAGIC = b'CRBM'
+_BIN_VERSION = 1
+BIN_HEADER_SIZE = _BIN_HEADER.size
+# Grid encodings of a binary map: one byte per tile, or one bit per tile packed most significant bit first
+BIN_BYTE_GRID = 0
+BIN_BIT_GRID = 1
+
+# Matches any byte of a binary byte grid that is not a tile value
+_INVALID_TILE = re.compile(b'[^\x00\x01]')
+# Translates the digits of a binary string into grid bytes, and back
+_BITS_TO_TILES = bytes.maketrans(b'01', b'\x00\x01')
+_TILES_TO_BITS = bytes.maketrans(b'\x00\x01', b'01')
 
 
 class _JSONmapData(BaseModel):
@@ -60,30 +85,143 @@ class _TXTmapData(BaseModel):
 
 
 class Map(BaseModel):
-    """Represents the map as 2D boolean grid map with defined dimensions."""
-    map: List[List[bool]] = Field(..., description="2D matrix of boolean representing the map", frozen=True)
+    """Represents the map as a compact row-major grid, storing one byte per tile, with defined dimensions."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    grid: Union[bytes, memoryview] = Field(
+        ..., description="Row-major grid of tiles: 1 if the tile is walkable, 0 otherwise", frozen=True)
     rows: int = Field(..., gt=0, description="Number of map's row. Must be greater than zero", frozen=True)
     cols: int = Field(..., gt=0, description="Number of map's column. Must be greater than zero", frozen=True)
 
-    def __init__(self, map: List[List[bool]], rows: int, cols: int):
-        super().__init__(map=map, rows=rows, cols=cols)
+    # Walkable runs of each row and column, as sorted arrays of first and last run positions. The runs of a column
+    # are only indexed when the robot first moves along it.
+    _row_runs: List[Tuple[array, array]] = []
+    _col_runs: List[Optional[Tuple[array, array]]] = []
+    # Number of walkable tiles, counted once from the runs of the rows
+    _walkable_tiles: int = 0
+
+    def __init__(self, grid: Union[bytes, memoryview], rows: int, cols: int):
+        super().__init__(grid=grid, rows=rows, cols=cols)
 
-        if len(self.map) != self.rows:
+        if len(self.grid) != self.rows * self.cols:
+            raise ValueError(
+                f"Number of tiles in the grid does not match the specified 'rows' and 'cols' values.")
+
+        # Index the walkable runs once, so that segment checks are binary searches
+        self._row_runs = [self.__index_runs(self.grid, y * self.cols, (y + 1) * self.cols) for y in range(self.rows)]
+        self._col_runs = [None] * self.cols
+        self._walkable_tiles = sum(sum(lasts) - sum(firsts) + len(firsts) for firsts, lasts in self._row_runs)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate number of bytes used by the grid and the walkable run index."""
+        index_bytes = sum(firsts.itemsize * len(firsts) * 2
+                          for firsts, _ in self._row_runs + [runs for runs in self._col_runs if runs is not None])
+        return len(self.grid) + index_bytes
+
+    @property
+    def walkable_tiles(self) -> int:
+        """Number of walkable tiles of the map, counted when the walkable run index is built."""
+        return self._walkable_tiles
+
+    @staticmethod
+    def __index_runs(line: bytes, start: int, stop: int) -> Tuple[array, array]:
+        """Returns the first and last positions of the walkable runs found in line[start:stop]."""
+        # The smallest item type holding every position of the line
+        typecode = 'H' if stop - start <= 1 << 16 else 'I' if stop - start <= 1 << 32 else 'Q'
+        firsts, lasts = array(typecode), array(typecode)
+        for run in _WALKABLE_RUN.finditer(line, start, stop):
+            firsts.append(run.start() - start)
+            lasts.append(run.end() - start - 1)
+        return firsts, lasts
+
+    @classmethod
+    def from_matrix(cls, map: List[List[bool]], rows: int, cols: int):
+        """Builds a map from a 2D matrix of boolean, where True marks a walkable tile."""
+        if len(map) != rows:
             raise ValueError(
                 f"Number of rows in the map does not match the specified 'rows' value.")
-        if any(len(row) != self.cols for row in self.map):
+        if any(len(row) != cols for row in map):
             raise ValueError(
                 f"One or more rows in the map have a different number of columns than the specified 'cols' value.")
 
+        return cls(grid=bytes(bool(tile) for row in map for tile in row), rows=rows, cols=cols)
+
     @classmethod
     def load(cls, file):
-        """Parses, validate and loads map data from a TXT or JSON file."""
+        """Parses, validate and loads map data from a TXT, JSON or binary file."""
         if file.filename.endswith('.txt'):
             return cls.__load_from_txt(file)
         elif file.filename.endswith('.json'):
             return cls.__load_from_json(file)
+        elif file.filename.endswith('.bin'):
+            return cls.__load_from_bin(file)
+        else:
+            raise ValueError(
+                f"Unsupported file format: {file.filename}. Only .txt, .json and .bin files are supported.")
+
+    def to_bin(self, encoding: int = BIN_BYTE_GRID) -> bytes:
+        """Exports the map in the binary format, with a byte or a packed bit grid."""
+        if encoding == BIN_BYTE_GRID:
+            payload = bytes(self.grid)
+        elif encoding == BIN_BIT_GRID:
+            # Pad the tiles to whole bytes and read them as the digits of a binary number
+            size = len(self.grid)
+            padding = -size % 8
+            bits = bytes(self.grid).translate(_TILES_TO_BITS) + b'0' * padding
+            payload = int(bits, 2).to_bytes((size + padding) // 8, 'big')
         else:
-            raise ValueError(f"Unsupported file format: {file.filename}. Only .txt and .json files are supported.")
+            raise ValueError(f"Unsupported binary grid encoding: {encoding}.")
+
+        return _BIN_HEADER.pack(_BIN_MAGIC, _BIN_VERSION, encoding, self.rows, self.cols) + payload
+
+    @staticmethod
+    def read_bin_header(data) -> Tuple[int, int, int]:
+        """Validates the header at the start of a binary map and returns its grid encoding, rows and cols."""
+        if len(data) < BIN_HEADER_SIZE:
+            raise ValueError("The file is too short to hold the map header.")
+
+        magic, version, encoding, rows, cols = _BIN_HEADER.unpack_from(data)
+        if magic != _BIN_MAGIC or version != _BIN_VERSION:
+            raise ValueError("The file is not a binary map of a supported version.")
+        if encoding not in (BIN_BYTE_GRID, BIN_BIT_GRID):
+            raise ValueError(f"Unsupported binary grid encoding: {encoding}.")
+        if rows <= 0 or cols <= 0:
+            raise ValueError("Number of rows and columns must be greater than zero.")
+
+        return encoding, rows, cols
+
+    @classmethod
+    def from_bin(cls, data: memoryview):
+        """Parses, validate and loads map data from a binary buffer. Byte grids are wrapped without copying,
+        so the map reads straight from the buffer, e.g. an uploaded file or a memory-mapped one."""
+        try:
+            encoding, rows, cols = cls.read_bin_header(data)
+
+            payload = data[BIN_HEADER_SIZE:]
+            size = rows * cols
+            if encoding == BIN_BYTE_GRID:
+                if len(payload) != size:
+                    raise ValueError("Mismatch: The byte grid must hold exactly rows × cols tiles.")
+                if _INVALID_TILE.search(payload):
+                    raise ValueError("Invalid tile found. Only 0 and 1 are allowed in a byte grid.")
+                grid = payload
+            else:
+                if len(payload) != (size + 7) // 8:
+                    raise ValueError("Mismatch: The bit grid must hold exactly rows × cols tiles.")
+                # Unpack the bits through their binary string, dropping the padding of the last byte
+                bits = format(int.from_bytes(payload, 'big'), f'0{len(payload) * 8}b').encode('ascii')
+                grid = bits[:size].translate(_BITS_TO_TILES)
+
+            return cls(grid=grid, rows=rows, cols=cols)
+
+        except (ValidationError, ValueError, struct.error) as e:
+            raise ValueError(f"Failed to load map from BIN: {e}")
+
+    @classmethod
+    def __load_from_bin(cls, file):
+        """Parses, validate and loads map data from a binary file."""
+        return cls.from_bin(memoryview(file.read()))
 
     @classmethod
     def __load_from_json(cls, file):
@@ -91,26 +229,90 @@ class Map(BaseModel):
         try:
             json_data = json.load(file)
 
-            # Validate the JSON structure with Pydantic
+            # Build the grid straight from the plain JSON data when it is well-formed
+            grid = cls.__grid_from_json(json_data)
+            if grid is not None:
+                return cls(grid=grid, rows=json_data["rows"], cols=json_data["cols"])
+
+            # Otherwise validate the JSON structure with Pydantic, which reports the errors
             map_data = _JSONmapData(**json_data)
 
             rows = map_data.rows
             cols = map_data.cols
-            map = [[False] * cols for _ in range(rows)]
+            grid = bytearray(rows * cols)
 
             for tile in map_data.tiles:
-                map[tile.y][tile.x] = tile.walkable
+                grid[tile.y * cols + tile.x] = tile.walkable
 
-            return cls(map=map, rows=rows, cols=cols)
+            return cls(grid=bytes(grid), rows=rows, cols=cols)
 
         except (ValidationError, ValueError) as e:
             raise ValueError(f"Failed to load map from JSON: {e}")
 
+    @staticmethod
+    def __grid_from_json(json_data) -> Optional[bytes]:
+        """Builds the grid of a well-formed JSON map without creating a model per tile.
+        Returns None as soon as the data is not exactly what _JSONmapData accepts as is."""
+        if type(json_data) is not dict:
+            return None
+        rows, cols, tiles = json_data.get("rows"), json_data.get("cols"), json_data.get("tiles")
+        if type(rows) is not int or type(cols) is not int or rows <= 0 or cols <= 0:
+            return None
+        if type(tiles) is not list or len(tiles) != rows * cols:
+            return None
+
+        grid = bytearray(rows * cols)
+        # Marks the cells already covered by a tile, to detect duplicates
+        covered = bytearray(rows * cols)
+        for tile in tiles:
+            if type(tile) is not dict:
+                return None
+            x, y, walkable = tile.get("x"), tile.get("y"), tile.get("walkable")
+            if type(x) is not int or type(y) is not int or type(walkable) is not bool:
+                return None
+            if not (0 <= x < cols and 0 <= y < rows):
+                return None
+            index = y * cols + x
+            if covered[index]:
+                return None
+            covered[index] = 1
+            grid[index] = walkable
+
+        # rows × cols distinct in-bounds tiles cover every grid cell exactly once
+        return bytes(grid)
+
+    @staticmethod
+    def __grid_from_txt(data: bytes) -> Optional[Tuple[bytes, int, int]]:
+        """Builds the grid of a well-formed TXT map, given without surrounding whitespace, in a few bytes passes.
+        Returns None unless the data only holds 'o' and 'x' rows of the same length separated by '\\n'."""
+        if not data or data.translate(None, b'ox\n'):
+            return None
+
+        cols = data.find(b'\n')
+        if cols == -1:
+            return data.translate(_TXT_TILES), 1, len(data)
+        rows = data.count(b'\n') + 1
+
+        # Rows of the same length put every separator exactly cols + 1 bytes after the previous one
+        if len(data) != rows * (cols + 1) - 1 or data[cols::cols + 1] != b'\n' * (rows - 1):
+            return None
+
+        return data.replace(b'\n', b'').translate(_TXT_TILES), rows, cols
+
     @classmethod
     def __load_from_txt(cls, file):
         """Parses, validate and loads map data from a TXT file."""
         try:
-            txt_data = file.read().decode('utf-8')
+            data = file.read()
+
+            # Translate the whole buffer at once when it is a well-formed grid
+            parsed = cls.__grid_from_txt(data.strip())
+            if parsed is not None:
+                grid, rows, cols = parsed
+                return cls(grid=grid, rows=rows, cols=cols)
+
+            # Otherwise validate it line by line, which reports the errors
+            txt_data = data.decode('utf-8')
             lines = txt_data.strip().splitlines()
 
             # Early validation for empty file
@@ -123,19 +325,44 @@ class Map(BaseModel):
             rows = txt_map_data.rows
             cols = txt_map_data.cols
 
-            map = [[char == 'o' for char in row] for row in txt_map_data.grid]
+            grid = bytes(char == 'o' for row in txt_map_data.grid for char in row)
 
-            return cls(map=map, rows=rows, cols=cols)
+            return cls(grid=grid, rows=rows, cols=cols)
 
         except (ValidationError, ValueError) as e:
             raise ValueError(f"Failed to load map from TXT: {e}")
 
     def is_walkable(self, x: int, y: int) -> bool:
         """Checks if a given tile is walkable."""
-        if self.map is None or self.rows is None or self.cols is None:
+        if self.grid is None or self.rows is None or self.cols is None:
             raise ValueError("Map is not initialized.")
 
         if not (0 <= x < self.cols and 0 <= y < self.rows):
             raise ValueError("Coordinates out of bounds.")
 
-        return self.map[y][x]
+        return self.grid[y * self.cols + x] == 1
+
+    def walkable_steps(self, x: int, y: int, dx: int, dy: int, steps: int) -> int:
+        """Returns how many of the given steps from the walkable tile (x, y) along the unit direction (dx, dy)
+        can be taken before leaving the map or reaching a non-walkable tile."""
+        if not (0 <= x < self.cols and 0 <= y < self.rows):
+            return 0
+
+        # Look up the walkable run of the row or column containing (x, y)
+        if dx:
+            firsts, lasts = self._row_runs[y]
+            position, delta = x, dx
+        else:
+            runs = self._col_runs[x]
+            if runs is None:
+                # Strided memoryviews cannot be searched, so the column is copied before being indexed
+                runs = self._col_runs[x] = self.__index_runs(bytes(self.grid[x::self.cols]), 0, self.rows)
+            firsts, lasts = runs
+            position, delta = y, dy
+        run = bisect_right(firsts, position) - 1
+        if run < 0 or lasts[run] < position:
+            return 0
+
+        # The robot can move up to the end of the run, which is either an obstacle or the map bound
+        reachable = lasts[run] - position if delta > 0 else position - firsts[run]
+        return min(steps, reachable)
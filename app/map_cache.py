@@ -0,0 +1,85 @@
+import hashlib
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Tuple
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from app.map import Map
+
+
+class MapCacheConfig(BaseSettings):
+    """Parsed map cache configuration"""
+    model_config = SettingsConfigDict(env_prefix='MAP_CACHE_')
+
+    max_entries: int = Field(default=32, ge=0, description="Maximum number of cached maps. Zero disables the cache.")
+    max_bytes: int = Field(default=256 * 1024 * 1024, ge=0, description="Maximum number of bytes used by the "
+                                                                        "cached maps.")
+
+
+class MapCache:
+    """
+    Bounded LRU cache of parsed maps, keyed by the format and a content hash of the uploaded file.
+    Maps are immutable, so the same instance is shared by every robot that loads the same file.
+    """
+
+    def __init__(self, config: MapCacheConfig):
+        self.config = config
+        self._maps: "OrderedDict[Tuple[str, bytes], Map]" = OrderedDict()
+        # Size of each cached map when it was added, since the column index of a map grows while it is used
+        self._sizes: Dict[Tuple[str, bytes], int] = {}
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, file) -> Map:
+        """Returns the map of the uploaded file, parsing it only if the same content is not already cached."""
+        data = file.read()
+        file.seek(0)
+        key = (os.path.splitext(file.filename)[1], hashlib.blake2b(data, digest_size=32).digest())
+
+        with self._lock:
+            map = self._maps.get(key)
+            if map is not None:
+                self._maps.move_to_end(key)
+                self.hits += 1
+                return map
+            self.misses += 1
+
+        # Parse outside the lock, so that other uploads are not blocked
+        map = Map.load(file)
+        self._put(key, map)
+        return map
+
+    def _put(self, key: Tuple[str, bytes], map: Map):
+        """Adds a map to the cache, evicting the least recently used maps to stay within the limits."""
+        size = map.nbytes
+        if self.config.max_entries == 0 or size > self.config.max_bytes:
+            return
+        with self._lock:
+            if key in self._maps:
+                return
+            self._maps[key] = map
+            self._sizes[key] = size
+            self._bytes += size
+            while len(self._maps) > self.config.max_entries or self._bytes > self.config.max_bytes:
+                evicted, _ = self._maps.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the cache counters."""
+        with self._lock:
+            return {"entries": len(self._maps), "bytes": self._bytes, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+    def clear(self):
+        """Removes every map from the cache."""
+        with self._lock:
+            self._maps.clear()
+            self._sizes.clear()
+            self._bytes = 0
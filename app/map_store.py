@@ -0,0 +1,164 @@
+import hashlib
+import mmap
+import os
+import tempfile
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from app.map import Map, BIN_BYTE_GRID, BIN_HEADER_SIZE
+
+
+class MapStoreConfig(BaseSettings):
+    """On-disk map store configuration"""
+    model_config = SettingsConfigDict(env_prefix='MAP_STORE_')
+
+    enabled: bool = Field(default=False, description="Store uploaded maps on disk and memory-map them, instead of "
+                                                     "keeping them in process memory")
+    directory: str = Field(default=os.path.join(tempfile.gettempdir(), "cleaning-robot-maps"),
+                           description="Directory of the stored maps, shared by every worker process")
+    max_file_size: int = Field(default=4 * 1024 * 1024 * 1024, gt=0, description="Maximum size of an uploaded "
+                                                                                 "map in bytes")
+    max_text_file_size: int = Field(default=2 * 1024 * 1024, gt=0, description="Maximum size of an uploaded TXT "
+                                                                               "or JSON map, or binary map with a "
+                                                                               "bit grid, in bytes, which is parsed "
+                                                                               "in memory before being stored")
+    max_store_size: int = Field(default=16 * 1024 * 1024 * 1024, gt=0, description="Total size of the stored maps "
+                                                                                   "in bytes, beyond which the "
+                                                                                   "least recently stored ones are "
+                                                                                   "removed")
+    chunk_size: int = Field(default=1024 * 1024, gt=0, description="Number of bytes copied at a time from an "
+                                                                  "upload to the store")
+
+
+class MapStore:
+    """
+    Stores uploaded maps once on disk as binary byte grids, named by their content hash, and opens them
+    memory-mapped. The maps read their tiles through the mapping, so worker processes loading the same map
+    share a single copy of its grid in the page cache. The walkable run index of each map is still built in the
+    memory of every process that opens it. Beyond the configured total size, the least recently stored maps are
+    removed, while the processes that already opened them keep reading their mapping.
+    """
+
+    def __init__(self, config: MapStoreConfig):
+        self.config = config
+        os.makedirs(self.config.directory, exist_ok=True)
+
+    def load(self, file) -> Map:
+        """Stores the uploaded map file and returns it memory-mapped from the store."""
+        if not self.__is_byte_grid(file):
+            # Other formats are parsed in memory once, then stored as a byte grid
+            self.__check_size(file)
+            path = self._write_bytes(Map.load(file).to_bin(BIN_BYTE_GRID))
+            map = self.open(path)
+        else:
+            # Byte grids are already in the stored format, so the upload is copied to disk and validated from there
+            path = self._write(file)
+            try:
+                map = self.open(path)
+            except ValueError:
+                os.remove(path)
+                raise
+        self._prune(path)
+        return map
+
+    @staticmethod
+    def __is_byte_grid(file) -> bool:
+        """Checks if the uploaded file is a binary map with a byte grid, leaving the file at its start."""
+        if not file.filename.endswith('.bin'):
+            return False
+        header = file.read(BIN_HEADER_SIZE)
+        file.seek(0)
+        try:
+            return Map.read_bin_header(header)[0] == BIN_BYTE_GRID
+        except ValueError:
+            return False
+
+    def __check_size(self, file):
+        """Checks the size of an upload parsed in memory before it is read, leaving the file at its start."""
+        max_file_size = min(self.config.max_file_size, self.config.max_text_file_size)
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(0)
+        if size > max_file_size:
+            raise ValueError(f"File is too large (max {max_file_size} bytes)")
+
+    @staticmethod
+    def open(path: str) -> Map:
+        """Returns the map stored at the given path, reading its grid through a read-only memory mapping."""
+        with open(path, 'rb') as stored:
+            mapping = mmap.mmap(stored.fileno(), 0, access=mmap.ACCESS_READ)
+        # The grid of the map is a view over the mapping, which stays open as long as the map is referenced
+        return Map.from_bin(memoryview(mapping))
+
+    def clear(self):
+        """Removes every stored map. Maps already opened keep reading their mapping."""
+        for name in os.listdir(self.config.directory):
+            if name.endswith('.bin'):
+                os.remove(os.path.join(self.config.directory, name))
+
+    def _write(self, file) -> str:
+        """Copies an upload to the store chunk by chunk and returns the path of the stored map."""
+        digest = hashlib.blake2b(digest_size=32)
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.config.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                while chunk := file.read(self.config.chunk_size):
+                    size += len(chunk)
+                    if size > self.config.max_file_size:
+                        raise ValueError(f"File is too large (max {self.config.max_file_size} bytes)")
+                    digest.update(chunk)
+                    temp.write(chunk)
+            return self._commit(temp_path, digest.hexdigest())
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _write_bytes(self, data: bytes) -> str:
+        """Writes a binary map to the store and returns its path."""
+        if len(data) > self.config.max_file_size:
+            raise ValueError(f"File is too large (max {self.config.max_file_size} bytes)")
+        fd, temp_path = tempfile.mkstemp(dir=self.config.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                temp.write(data)
+            return self._commit(temp_path, hashlib.blake2b(data, digest_size=32).hexdigest())
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _commit(self, temp_path: str, name: str) -> str:
+        """Links a written map to its content-addressed path. The link is atomic, so other processes only ever
+        open complete files, and a map stored twice keeps the file, and the page cache, already mapped by them."""
+        path = os.path.join(self.config.directory, f"{name}.bin")
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            # Mark the stored map as recently stored, so that it is the last one to be removed
+            os.utime(path)
+        os.remove(temp_path)
+        return path
+
+    def _prune(self, keep: str):
+        """Removes the least recently stored maps, other than the given one, until the stored maps fit in the
+        configured total size. Maps removed by another process meanwhile are skipped."""
+        stored = []
+        for name in os.listdir(self.config.directory):
+            path = os.path.join(self.config.directory, name)
+            if not name.endswith('.bin') or path == keep:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stored.append((stat.st_mtime, stat.st_size, path))
+        total = os.path.getsize(keep) + sum(size for _, size, _ in stored)
+        for _, size, path in sorted(stored):
+            if total <= self.config.max_store_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
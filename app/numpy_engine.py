@@ -0,0 +1,96 @@
+from typing import Callable, Iterator, List, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # The numpy engine is only available when NumPy is installed
+    np = None
+
+from app.cleaned_tiles import CleanedTiles
+from app.map import Map
+from app.robot_path import RobotPath, RobotPathStream, CODE_DELTAS
+
+# Number of steps expanded at once, which bounds the memory used to follow a block of actions
+_BLOCK_STEPS = 1 << 20
+
+if np is not None:
+    # Unit movement along x and y of each direction code
+    _CODE_DX = np.array([dx for dx, _ in CODE_DELTAS], dtype=np.intp)
+    _CODE_DY = np.array([dy for _, dy in CODE_DELTAS], dtype=np.intp)
+
+
+def follow_path(map: Map, x: int, y: int, path: Union[RobotPath, RobotPathStream],
+                step: Callable) -> Iterator[Tuple["np.ndarray", "np.ndarray"]]:
+    """
+    Follows the path from (x, y) one block of actions at a time and yields the x and y coordinates of the tiles
+    visited by each block. Each block is expanded into one step per tile, whose positions are the cumulative sum
+    of the direction deltas, and checked against the map with a single lookup. At the first step that is out of
+    bounds or not walkable, yields the tiles visited before it and calls step() onto it, which raises the error.
+    """
+    grid = np.frombuffer(map.grid, dtype=np.uint8)
+    rows, cols = map.rows, map.cols
+    # An action longer than the map necessarily leaves it, so its steps beyond the map size do not change the result
+    limit = max(rows, cols)
+
+    for directions, steps in path.iter_move_blocks(max(1, _BLOCK_STEPS // limit)):
+        counts = np.minimum(np.frombuffer(steps, dtype=np.uint64), limit).astype(np.intp)
+        codes = np.repeat(np.frombuffer(directions, dtype=np.uint8), counts)
+        if not codes.size:
+            continue
+
+        xs = x + np.cumsum(_CODE_DX[codes])
+        ys = y + np.cumsum(_CODE_DY[codes])
+        inside = (xs >= 0) & (xs < cols) & (ys >= 0) & (ys < rows)
+        walkable = inside & (grid[np.where(inside, ys * cols + xs, 0)] == 1)
+
+        if not walkable.all():
+            blocked = int(np.argmin(walkable))
+            if blocked:
+                yield xs[:blocked], ys[:blocked]
+                x, y = int(xs[blocked - 1]), int(ys[blocked - 1])
+            # Moving onto the blocked step raises the out of bounds or non-walkable tile error
+            step(x, y, *CODE_DELTAS[codes[blocked]])
+
+        yield xs, ys
+        x, y = int(xs[-1]), int(ys[-1])
+
+
+def to_tiles(xs: "np.ndarray", ys: "np.ndarray") -> List[Tuple[int, int]]:
+    """Returns the tiles of the given coordinates, in order."""
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def first_visits(xs: "np.ndarray", ys: "np.ndarray", previous_cleaned_tiles: CleanedTiles,
+                 cleaned_tiles: CleanedTiles) -> List[Tuple[int, int]]:
+    """
+    Cleans the tiles of the given coordinates that were neither cleaned in the previous session nor already
+    cleaned, and returns them in the order of their first visit.
+    """
+    cols = cleaned_tiles.cols
+    indices = ys * cols + xs
+    # First visit of each tile, in the order of the visits
+    _, first = np.unique(indices, return_index=True)
+    first.sort()
+    indices = indices[first]
+
+    bitmap = np.frombuffer(cleaned_tiles.bitmap, dtype=np.uint8)
+    new = bitmap[indices] == 0
+    new &= ~_previously_cleaned(xs[first], ys[first], indices, previous_cleaned_tiles, cleaned_tiles)
+    bitmap[indices[new]] = 1
+
+    tiles = to_tiles(xs[first[new]], ys[first[new]])
+    cleaned_tiles.extend(tiles)
+    return tiles
+
+
+def _previously_cleaned(xs: "np.ndarray", ys: "np.ndarray", indices: "np.ndarray",
+                        previous_cleaned_tiles: CleanedTiles, cleaned_tiles: CleanedTiles) -> "np.ndarray":
+    """Returns which of the given tiles were cleaned in the previous session, which may have been on a map
+    of another size."""
+    previous = np.frombuffer(previous_cleaned_tiles.bitmap, dtype=np.uint8)
+    if (previous_cleaned_tiles.rows, previous_cleaned_tiles.cols) == (cleaned_tiles.rows, cleaned_tiles.cols):
+        return previous[indices] == 1
+    if not previous.size:
+        return np.zeros(len(indices), dtype=bool)
+    # The tiles are located in the previous bitmap by their coordinates, as CleanedTiles.__contains__ does
+    inside = (xs < previous_cleaned_tiles.cols) & (ys < previous_cleaned_tiles.rows)
+    return inside & (previous[np.where(inside, ys * previous_cleaned_tiles.cols + xs, 0)] == 1)
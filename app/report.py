@@ -0,0 +1,107 @@
+from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field
+
+from app.robot_path import DIRECTION_DELTAS
+
+# Formats in which a cleaning report can be returned: the compact format encodes the cleaned tiles as runs,
+# the stream format sends the full report while cleaning, and the metrics format only measures the session
+REPORT_FORMATS = ("full", "compact", "stream", "metrics")
+
+# Action direction matching each unit movement (dx, dy)
+_DIRECTION_NAMES = {delta: direction for direction, delta in DIRECTION_DELTAS.items()}
+
+
+class RunEncoder:
+    """
+    Run-length encoder of a sequence of tiles as [x, y, direction, steps] runs: each run starts at tile (x, y) and
+    continues for the given number of steps in the given direction. An isolated tile is encoded with no direction
+    and zero steps. Straight segments of tiles are encoded in constant time, without listing their tiles.
+    """
+
+    def __init__(self):
+        self.runs: List[list] = []
+        self._run: Optional[list] = None
+        self._last_x = self._last_y = self._dx = self._dy = 0
+
+    def add(self, x: int, y: int):
+        """Appends a tile to the sequence."""
+        run = self._run
+        if run is not None:
+            if run[2] is None:
+                # The second tile of a run sets its direction
+                direction = _DIRECTION_NAMES.get((x - self._last_x, y - self._last_y))
+                if direction is not None:
+                    run[2], run[3] = direction, 1
+                    self._dx, self._dy = x - self._last_x, y - self._last_y
+                    self._last_x, self._last_y = x, y
+                    return
+            elif x - self._last_x == self._dx and y - self._last_y == self._dy:
+                run[3] += 1
+                self._last_x, self._last_y = x, y
+                return
+        # Start a new run at this tile
+        self._run = [x, y, None, 0]
+        self.runs.append(self._run)
+        self._last_x, self._last_y = x, y
+
+    def add_segment(self, x: int, y: int, dx: int, dy: int, steps: int):
+        """Appends the tiles reached by the given steps from (x, y) along the unit direction (dx, dy), excluding
+        (x, y) itself, exactly as adding them one by one would."""
+        # From the third tile on, the current run always follows the direction of the segment
+        for i in range(1, min(steps, 3) + 1):
+            self.add(x + dx * i, y + dy * i)
+        if steps > 3:
+            self._run[3] += steps - 3
+            self._last_x, self._last_y = x + dx * steps, y + dy * steps
+
+
+def decode_runs(runs: Sequence[list]) -> List[Tuple[int, int]]:
+    """Expands [x, y, direction, steps] runs produced by RunEncoder back into the list of tiles."""
+    tiles = []
+    for x, y, direction, steps in runs:
+        dx, dy = DIRECTION_DELTAS[direction] if direction is not None else (0, 0)
+        tiles.extend((x + dx * i, y + dy * i) for i in range(steps + 1))
+    return tiles
+
+
+class CleaningReport(BaseModel):
+    """Report of a cleaning session, with the cleaned tiles, the final status and the error message if any."""
+    cleaned_tiles: List[Tuple[int, int]] = Field(..., description="Cleaned tiles, in the order they were cleaned")
+    status: Literal["completed", "error"] = Field(..., description="Final state of the cleaning session")
+    error: Optional[str] = Field(None, description="Error that stopped the cleaning session, if any")
+
+    @classmethod
+    def build(cls, cleaned_tiles: List[Tuple[int, int]], status: str, error: Optional[str] = None) -> "CleaningReport":
+        """Builds a report from the tiles produced by the robot, without validating every tile again."""
+        return cls.model_construct(cleaned_tiles=cleaned_tiles, status=status, error=error)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the report as a JSON-serializable dict."""
+        return {"cleaned_tiles": self.cleaned_tiles, "status": self.status, "error": self.error}
+
+
+class CleaningMetrics(BaseModel):
+    """Metrics of a cleaning session, measured without listing its tiles."""
+    cleaned_tiles: int = Field(0, description="Number of tiles cleaned, as stored with the session")
+    unique_tiles: int = Field(0, description="Number of distinct tiles visited, including the starting tile")
+    revisits: int = Field(0, description="Number of steps onto a tile already visited in the session")
+    coverage: float = Field(0.0, description="Percentage of the walkable tiles of the map visited in the session")
+    path_length: int = Field(0, description="Number of steps performed")
+    status: Literal["completed", "error"] = Field("completed", description="Final state of the cleaning session")
+    error: Optional[str] = Field(None, description="Error that stopped the cleaning session, if any")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the metrics as a JSON-serializable dict."""
+        return self.model_dump()
+
+
+class CompactCleaningReport(BaseModel):
+    """Report of a cleaning session whose cleaned tiles are run-length encoded, built without listing the tiles."""
+    cleaned_runs: List[list] = Field(..., description="Cleaned tiles as [x, y, direction, steps] runs, in order")
+    status: Literal["completed", "error"] = Field(..., description="Final state of the cleaning session")
+    error: Optional[str] = Field(None, description="Error that stopped the cleaning session, if any")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the report as a JSON-serializable dict."""
+        return {"cleaned_runs": self.cleaned_runs, "status": self.status, "error": self.error}
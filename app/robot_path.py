@@ -1,11 +1,34 @@
-from pydantic import BaseModel, Field, ValidationError
-from typing import List, Literal
+from array import array
+from collections.abc import Sequence
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, computed_field, field_serializer
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Iterable, Iterator, List, Literal, Optional, Tuple
 import json
 
+# Unit movement (dx, dy) on the map for each action direction
+DIRECTION_DELTAS = {"north": (0, -1), "east": (1, 0), "south": (0, 1), "west": (-1, 0)}
+# Action directions by integer code, with the code of each direction and the unit movement of each code
+DIRECTIONS = ("north", "east", "south", "west")
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+CODE_DELTAS = tuple(DIRECTION_DELTAS[direction] for direction in DIRECTIONS)
+# Largest number of steps of an action stored in the unsigned 64-bit steps array
+_MAX_STEPS = 2 ** 64 - 1
+
+
+class RobotPathConfig(BaseSettings):
+    """Robot path loading configuration"""
+    model_config = SettingsConfigDict(env_prefix='ROBOT_PATH_')
+
+    stream: bool = Field(default=False, description="Parse the actions lazily while the robot follows them, "
+                                                    "instead of loading the whole path before cleaning")
+    max_stream_file_size: int = Field(default=512 * 1024 * 1024, gt=0, description="Maximum size in bytes of a "
+                                                                                  "TXT actions file parsed lazily")
+
 
 class RobotPath(BaseModel):
     """
     Represents the robot's path, starting from coordinates (x, y) and a list of actions to follow.
+    The actions are stored as two compact arrays of direction codes and step counts.
     """
     class Action(BaseModel):
         """
@@ -16,7 +39,68 @@ class RobotPath(BaseModel):
 
     x: int = Field(..., ge=0, description="Starting x coordinate of the path. Must be greater than or equal to zero", frozen=True)
     y: int = Field(..., ge=0, description="Starting y coordinate of the path. Must be greater than or equal to zero", frozen=True)
-    actions: List[Action] = Field(..., description="Ordered list of actions to follow", frozen=True)
+
+    # Direction code and number of steps of each action, in order
+    _directions: array = array('B')
+    _steps: array = array('Q')
+
+    def __init__(self, **data):
+        actions = data.get('actions')
+        codes = self.__encode_actions(actions) if isinstance(actions, (list, tuple)) else None
+        if codes is None:
+            # Validate the whole path with one model per action, which reports the errors and coerces lax values
+            codes = self.__encode_actions(_RobotPathData(**data).actions)
+            if codes is None:
+                raise ValueError(f"Number of steps of an action must be at most {_MAX_STEPS}.")
+        data.pop('actions')
+        super().__init__(**data)
+        self._directions, self._steps = codes
+
+    @classmethod
+    def __encode_actions(cls, actions) -> Optional[Tuple[array, array]]:
+        """Encodes the actions into direction codes and step counts.
+        Returns None as soon as an action is not exactly what the Action model accepts as is."""
+        directions, steps = array('B'), array('Q')
+        for action in actions:
+            if type(action) is cls.Action:
+                direction, count = action.direction, action.steps
+            elif type(action) is dict:
+                direction, count = action.get('direction'), action.get('steps')
+                if type(count) is not int:
+                    return None
+            else:
+                return None
+            code = DIRECTION_CODES.get(direction) if type(direction) is str else None
+            if code is None or not 0 <= count <= _MAX_STEPS:
+                return None
+            directions.append(code)
+            steps.append(count)
+        return directions, steps
+
+    @computed_field(description="Ordered list of actions to follow")
+    @property
+    def actions(self) -> List["RobotPath.Action"]:
+        """Ordered list of actions to follow, as a read-only view building each action when it is accessed."""
+        return ActionsView(self._directions, self._steps)
+
+    @field_serializer('actions')
+    def _serialize_actions(self, actions: "ActionsView") -> List["RobotPath.Action"]:
+        """Serializes the actions view as the list of actions."""
+        return list(actions)
+
+    @classmethod
+    def model_json_schema(cls, *args, **kwargs):
+        """Returns the JSON schema of the path data, whose actions are validated as a list of Action models."""
+        return _RobotPathData.model_json_schema(*args, **kwargs)
+
+    def iter_moves(self) -> Iterator[Tuple[int, int]]:
+        """Yields the direction code and number of steps of each action, in order."""
+        return zip(self._directions, self._steps)
+
+    def iter_move_blocks(self, size: int) -> Iterator[Tuple[array, array]]:
+        """Yields the direction codes and numbers of steps of consecutive blocks of at most size actions."""
+        for start in range(0, len(self._directions), size):
+            yield self._directions[start:start + size], self._steps[start:start + size]
 
     @classmethod
     def load(cls, file):
@@ -37,7 +121,7 @@ class RobotPath(BaseModel):
         try:
             data = json.load(file)
             return cls(**data)
-        except (json.JSONDecodeError, ValidationError, KeyError) as e:
+        except (json.JSONDecodeError, ValidationError, KeyError, ValueError) as e:
             raise ValueError(f"Failed to load actions from JSON: {e}")
 
     @classmethod
@@ -51,13 +135,153 @@ class RobotPath(BaseModel):
             lines = txt_data.splitlines()
             # Parse starting position (first line contains x, y)
             x, y = map(int, lines[0].strip().split())
-            actions = []
+            path = cls(x=x, y=y, actions=[])
 
-            # Parse action lines
+            # Parse action lines straight into the arrays, only building an Action model to report an invalid one
+            directions, steps_counts = path._directions, path._steps
             for line in lines[1:]:
                 direction, steps = line.strip().split()
-                actions.append(cls.Action(direction=direction.lower(), steps=int(steps)))
+                direction, steps = direction.lower(), int(steps)
+                code = DIRECTION_CODES.get(direction)
+                if code is None or steps < 0:
+                    cls.Action(direction=direction, steps=steps)
+                directions.append(code)
+                steps_counts.append(steps)
 
-            return cls(x=x, y=y, actions=actions)
-        except (ValueError, IndexError, ValidationError) as e:
+            return path
+        except (ValueError, IndexError, ValidationError, OverflowError) as e:
+            raise ValueError(f"Failed to load actions from JSON: {e}")
+
+    @classmethod
+    def stream(cls, file) -> "RobotPathStream":
+        """
+        Loads the starting position of the robot's path from a TXT or JSON file, and returns a path whose actions
+        are parsed and validated one at a time while they are iterated. A malformed action is only reported when
+        it is reached, by raising a ValueError from the iteration.
+        """
+        if file.filename.endswith('.txt'):
+            return cls.__stream_from_txt(file)
+        elif file.filename.endswith('.json'):
+            return cls.__stream_from_json(file)
+        else:
+            raise ValueError(f"Unsupported file format: {file.filename}. Only .txt and .json files are supported.")
+
+    @classmethod
+    def __stream_from_json(cls, file) -> "RobotPathStream":
+        """
+        Loads the robot's path from a JSON file, validating the actions lazily.
+        The document is decoded at once, but no action model is built before it is reached.
+        """
+        try:
+            data = json.load(file)
+            if not isinstance(data, dict) or not isinstance(data.get('actions'), list):
+                raise ValueError("The path must be an object with a list of actions.")
+            return RobotPathStream(**dict(data, actions=cls.__iter_json_actions(data['actions'])))
+        except (json.JSONDecodeError, ValidationError, ValueError) as e:
             raise ValueError(f"Failed to load actions from JSON: {e}")
+
+    @classmethod
+    def __iter_json_actions(cls, actions: list) -> Iterator["RobotPath.Action"]:
+        """Validates the decoded JSON actions one at a time."""
+        for action in actions:
+            try:
+                yield cls.Action.model_validate(action)
+            except ValidationError as e:
+                raise ValueError(f"Failed to load actions from JSON: {e}")
+
+    @classmethod
+    def __stream_from_txt(cls, file) -> "RobotPathStream":
+        """
+        Loads the robot's path from a TXT file, reading the action lines from the file only when they are reached.
+        """
+        try:
+            # Parse starting position (first line contains x, y)
+            x, y = map(int, file.readline().decode('utf-8').strip().split())
+            return RobotPathStream(x=x, y=y, actions=cls.__iter_txt_actions(file))
+        except (ValueError, ValidationError) as e:
+            raise ValueError(f"Failed to load actions from TXT: {e}")
+
+    @classmethod
+    def __iter_txt_actions(cls, file) -> Iterator["RobotPath.Action"]:
+        """Parses the action lines of a TXT file one at a time."""
+        while line := file.readline():
+            try:
+                direction, steps = line.decode('utf-8').strip().split()
+                action = cls.Action(direction=direction.lower(), steps=int(steps))
+            except (ValueError, ValidationError) as e:
+                raise ValueError(f"Failed to load actions from TXT: {e}")
+            yield action
+
+
+class _RobotPathData(BaseModel):
+    """Robot path data with one model per action, only used to validate the paths that need coercion or errors."""
+    model_config = ConfigDict(title="RobotPath")
+
+    x: int = Field(..., ge=0, description="Starting x coordinate of the path. Must be greater than or equal to zero")
+    y: int = Field(..., ge=0, description="Starting y coordinate of the path. Must be greater than or equal to zero")
+    actions: List[RobotPath.Action] = Field(..., description="Ordered list of actions to follow")
+
+
+class ActionsView(Sequence):
+    """Read-only sequence of the actions of a path, building each Action model when it is accessed."""
+
+    def __init__(self, directions: array, steps: array):
+        self._directions = directions
+        self._steps = steps
+
+    def __len__(self) -> int:
+        return len(self._directions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return RobotPath.Action.model_construct(direction=DIRECTIONS[self._directions[index]], steps=self._steps[index])
+
+    def __iter__(self) -> Iterator[RobotPath.Action]:
+        for code, steps in zip(self._directions, self._steps):
+            yield RobotPath.Action.model_construct(direction=DIRECTIONS[code], steps=steps)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (ActionsView, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ActionsView({list(self)!r})"
+
+
+class RobotPathStream(BaseModel):
+    """
+    Represents the robot's path, starting from coordinates (x, y), whose actions are parsed while they are followed.
+    The actions can only be iterated once.
+    """
+    x: int = Field(..., ge=0, description="Starting x coordinate of the path. Must be greater than or equal to zero",
+                    frozen=True)
+    y: int = Field(..., ge=0, description="Starting y coordinate of the path. Must be greater than or equal to zero",
+                    frozen=True)
+    actions: Iterable[RobotPath.Action] = Field(..., description="Actions to follow, parsed on iteration", frozen=True)
+
+    def iter_moves(self) -> Iterator[Tuple[int, int]]:
+        """Yields the direction code and number of steps of each action, in order, while they are parsed."""
+        for action in self.actions:
+            yield DIRECTION_CODES[action.direction], action.steps
+
+    def iter_move_blocks(self, size: int) -> Iterator[Tuple[array, array]]:
+        """Yields the direction codes and numbers of steps of consecutive blocks of at most size actions,
+        parsing each block only when it is reached. When an action cannot be parsed, the valid actions before it
+        are yielded first, so that they are followed before the parsing error is raised. Numbers of steps that do
+        not fit the steps array are clamped, as such actions leave any map long before their last step."""
+        directions, steps = array('B'), array('Q')
+        try:
+            for code, count in self.iter_moves():
+                directions.append(code)
+                steps.append(min(count, _MAX_STEPS))
+                if len(directions) == size:
+                    yield directions, steps
+                    directions, steps = array('B'), array('Q')
+        except ValueError:
+            if directions:
+                yield directions, steps
+            raise
+        if directions:
+            yield directions, steps
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Type
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from app.cleaning_robot import BaseCleaningRobot, CleaningRobot, PremiumCleaningRobot
+from app.map import Map
+
+# Robot classes by the type name used in the requests
+ROBOT_TYPES: Dict[str, Type[CleaningRobot]] = {"base": BaseCleaningRobot, "premium": PremiumCleaningRobot}
+
+
+def check_robot_type(robot_type: str):
+    """Raises a ValueError if the robot type is not supported."""
+    if robot_type not in ROBOT_TYPES:
+        raise ValueError(f"Unsupported robot type: {robot_type}. "
+                         f"Supported types are: {', '.join(ROBOT_TYPES)}.")
+
+
+class RobotRegistryConfig(BaseSettings):
+    """Robot registry configuration"""
+    model_config = SettingsConfigDict(env_prefix='ROBOT_REGISTRY_')
+
+    max_robots: int = Field(default=256, gt=0, description="Maximum number of robots kept in memory. The least "
+                                                          "recently used idle robots are evicted beyond it.")
+
+
+class RegisteredRobot:
+    """A robot of the registry, with the lock serializing the requests that use it."""
+
+    def __init__(self, robot: CleaningRobot):
+        self.robot = robot
+        self.lock = Lock()
+
+
+class RobotRegistry:
+    """
+    Registry of cleaning robots keyed by robot ID. Each robot has its own lock, so requests for different robots
+    run concurrently while requests for the same robot are serialized. Beyond the configured size, the least
+    recently used idle robots are evicted, together with their map and cleaned tiles.
+    """
+
+    def __init__(self, config: RobotRegistryConfig, engine: str = "python"):
+        self.config = config
+        # Simulation engine of the robots created by the registry
+        self.engine = engine
+        self._robots: "OrderedDict[str, RegisteredRobot]" = OrderedDict()
+        self._lock = Lock()
+        self.evictions = 0
+
+    def register(self, robot_id: str, robot: CleaningRobot) -> RegisteredRobot:
+        """Adds a robot under the given ID, replacing any robot with the same ID."""
+        with self._lock:
+            return self.__add(robot_id, robot)
+
+    def get(self, robot_id: str) -> Optional[RegisteredRobot]:
+        """Returns the robot with the given ID, or None if there is none, and marks it as recently used."""
+        with self._lock:
+            registered = self._robots.get(robot_id)
+            if registered is not None:
+                self._robots.move_to_end(robot_id)
+            return registered
+
+    def get_or_create(self, robot_id: str, robot_type: Optional[str] = None,
+                      map: Optional[Map] = None) -> RegisteredRobot:
+        """Returns the robot with the given ID, creating a robot of the given type with the given map if there is
+        none or if the registered one has another type. Without a type, the registered robot is kept whatever its
+        type, and a new robot is a base robot."""
+        if robot_type is not None:
+            check_robot_type(robot_type)
+        with self._lock:
+            registered = self._robots.get(robot_id)
+            if registered is not None and (robot_type is None or type(registered.robot) is ROBOT_TYPES[robot_type]):
+                self._robots.move_to_end(robot_id)
+                return registered
+            return self.__add(robot_id, ROBOT_TYPES[robot_type or "base"](map=map, engine=self.engine))
+
+    def remove(self, robot_id: str) -> bool:
+        """Removes the robot with the given ID and returns whether there was one."""
+        with self._lock:
+            return self._robots.pop(robot_id, None) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._robots)
+
+    def __add(self, robot_id: str, robot: CleaningRobot) -> RegisteredRobot:
+        """Adds a robot as the most recently used one, then evicts the robots in excess. Must hold the lock."""
+        registered = RegisteredRobot(robot)
+        self._robots[robot_id] = registered
+        self._robots.move_to_end(robot_id)
+        self.__evict()
+        return registered
+
+    def __evict(self):
+        """Evicts the least recently used idle robots beyond the maximum number of robots. Must hold the lock."""
+        excess = len(self._robots) - self.config.max_robots
+        if excess <= 0:
+            return
+        # The most recently used robot is the one being registered, and is always kept
+        for robot_id, registered in list(self._robots.items())[:-1]:
+            if excess == 0:
+                break
+            # A busy robot cannot be locked without blocking, and is kept until it is idle
+            if not registered.lock.acquire(blocking=False):
+                continue
+            try:
+                del self._robots[robot_id]
+            finally:
+                registered.lock.release()
+            self.evictions += 1
+            excess -= 1
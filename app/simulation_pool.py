@@ -0,0 +1,150 @@
+import atexit
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+from typing import List, Optional, Tuple, Union
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from app.cleaning_robot import BaseCleaningRobot
+from app.database import CleaningSession
+from app.map import Map, BIN_BYTE_GRID, BIN_HEADER_SIZE
+from app.report import CleaningMetrics, CleaningReport, CompactCleaningReport
+from app.robot_path import RobotPath
+
+
+class SimulationPoolConfig(BaseSettings):
+    """Parallel batch simulation configuration"""
+    model_config = SettingsConfigDict(env_prefix='SIMULATION_POOL_')
+
+    enabled: bool = Field(default=False, description="Simulate the independent sessions of a batch in a pool of "
+                                                     "processes")
+    max_workers: int = Field(default=os.cpu_count() or 1, gt=0, description="Number of worker processes")
+    min_batch_size: int = Field(default=16, gt=0, description="Smallest batch simulated in the pool, smaller batches "
+                                                             "are simulated in the request process")
+
+
+# Map shared with the current worker process: name of its shared memory block, the block and the map reading it
+_worker_map: Optional[Tuple[str, SharedMemory, Map]] = None
+
+
+def _attach_map(name: str) -> Map:
+    """Returns the map of the given shared memory block, attaching it and indexing its runs once per worker."""
+    global _worker_map
+    if _worker_map is not None and _worker_map[0] == name:
+        return _worker_map[2]
+
+    if _worker_map is None:
+        atexit.register(_release_map)
+    _release_map()
+
+    shared = SharedMemory(name=name)
+    # The block may be larger than requested, so the map is read up to the size given by its header
+    _, rows, cols = Map.read_bin_header(shared.buf)
+    map = Map.from_bin(shared.buf[:BIN_HEADER_SIZE + rows * cols])
+    _worker_map = (name, shared, map)
+    return map
+
+
+def _release_map():
+    """Closes the shared memory block of the worker map."""
+    global _worker_map
+    if _worker_map is not None:
+        # Release the map before closing the block, since its grid is a view over the block
+        shared = _worker_map[1]
+        _worker_map = None
+        shared.close()
+
+
+def _simulate_path(name: str, engine: str, report_format: str, path: RobotPath) \
+        -> Tuple[Union[CleaningReport, CompactCleaningReport, CleaningMetrics], CleaningSession]:
+    """Simulates the cleaning session of one path with a base robot on the shared map."""
+    (result,) = BaseCleaningRobot(map=_attach_map(name), engine=engine).simulate([path], report_format)
+    return result
+
+
+class SimulationPool:
+    """
+    Pool of worker processes simulating independent cleaning sessions in parallel. The map is copied once
+    into a shared memory block that every worker reads, instead of being pickled with each path.
+    Results are returned in the order of the paths, so a batch gives the same reports as a serial run.
+    """
+
+    def __init__(self, config: SimulationPoolConfig, engine: str = "python"):
+        self.config = config
+        # Simulation engine of the robots of the workers
+        self.engine = engine
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Map currently shared with the workers, and its shared memory block
+        self._shared: Optional[Tuple[Map, SharedMemory]] = None
+        # One batch at a time, since every batch already uses all the workers
+        self._lock = Lock()
+        atexit.register(self.close)
+
+    def accepts(self, batch_size: int) -> bool:
+        """Checks if a batch is large enough to be worth simulating in the pool."""
+        return batch_size >= self.config.min_batch_size
+
+    def simulate(self, map: Map, paths: List[RobotPath],
+                 report_format: str = "full") \
+            -> List[Tuple[Union[CleaningReport, CompactCleaningReport, CleaningMetrics], CleaningSession]]:
+        """Simulates one cleaning session per path on the map with a base robot, and returns their reports
+        in the given format with their unsaved sessions, in the order of the paths. When a worker dies,
+        the pool is restarted and the batch retried once, then the batch is simulated in the calling process."""
+        with self._lock:
+            name = self.__share(map)
+            simulate_path = partial(_simulate_path, name, self.engine, report_format)
+            # A few chunks per worker balance the load while amortizing the transfer of the paths
+            chunksize = max(1, len(paths) // (self.config.max_workers * 4))
+            for _ in range(2):
+                try:
+                    return list(self.__start().map(simulate_path, paths, chunksize=chunksize))
+                except BrokenProcessPool:
+                    # A broken executor never recovers, so it is discarded and the next batch starts a new one
+                    self.__stop()
+        return BaseCleaningRobot(map=map, engine=self.engine).simulate(paths, report_format)
+
+    def close(self):
+        """Stops the workers and frees the shared map."""
+        with self._lock:
+            self.__stop()
+            self.__unshare()
+
+    def __start(self) -> ProcessPoolExecutor:
+        """Returns the executor of the workers, starting it if needed."""
+        if self._executor is None:
+            # Spawned workers do not inherit the locks and connections of the threads of the application
+            self._executor = ProcessPoolExecutor(max_workers=self.config.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def __stop(self):
+        """Stops the workers, cancelling their pending simulations."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __share(self, map: Map) -> str:
+        """Copies the map into a shared memory block, unless it is already shared, and returns the block name."""
+        if self._shared is not None and self._shared[0] is map:
+            return self._shared[1].name
+        self.__unshare()
+
+        data = map.to_bin(BIN_BYTE_GRID)
+        shared = SharedMemory(create=True, size=len(data))
+        shared.buf[:len(data)] = data
+        self._shared = (map, shared)
+        return shared.name
+
+    def __unshare(self):
+        """Frees the shared memory block of the map shared with the workers."""
+        if self._shared is not None:
+            _, shared = self._shared
+            self._shared = None
+            shared.close()
+            shared.unlink()
@@ -0,0 +1,52 @@
+"""
+Benchmark of the fast paths of the JSON and TXT map loaders.
+
+Times the loading of well-formed maps through the fast paths and through the validation they replace, on the
+same file with the fast path disabled. The timings depend on the machine and on tracing tools such as coverage,
+so this script is run on its own rather than as part of the test suite:
+
+    python tests/benchmarks/map_loading.py
+"""
+import io
+import json
+import os
+import sys
+import time
+from unittest import mock
+
+from werkzeug.datastructures import FileStorage
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from app.map import Map
+
+
+def best_load_time(content: bytes, filename: str, repeat: int = 3) -> float:
+    """Returns the shortest time taken to load the given map file, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        Map.load(FileStorage(stream=io.BytesIO(content), filename=filename))
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare(name: str, content: bytes, filename: str, fast_path: str):
+    """Prints the load time of the map through the fast path and through the validation."""
+    fast = best_load_time(content, filename)
+    with mock.patch.object(Map, fast_path, staticmethod(lambda data: None)):
+        validated = best_load_time(content, filename)
+    print(f"{name}: fast path {fast:.3f}s, validation {validated:.3f}s, speedup {validated / fast:.1f}x")
+
+
+def main():
+    tiles = [{"x": x, "y": y, "walkable": x % 50 != 49} for y in range(200) for x in range(200)]
+    compare("200x200 JSON map", json.dumps({"rows": 200, "cols": 200, "tiles": tiles}).encode(), "map.json",
+            "_Map__grid_from_json")
+
+    # Few obstacles keep the run index cheap, so that the time is spent parsing
+    content = b"\n".join(bytes(b"ox"[x % 50 == 49] for x in range(500)) for y in range(500))
+    compare("500x500 TXT map", content, "map.txt", "_Map__grid_from_txt")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import io
 import os
+import random
 import sys
 from datetime import datetime, timedelta
 
@@ -66,6 +67,41 @@ def map_actions_files(request) -> tuple:
     return map_data, actions_data
 
 
+@pytest.fixture
+def upload():
+    """
+    Fixture that provides a function returning an uploaded file with the given content.
+    """
+    def make_upload(content: bytes, filename: str = "map.txt") -> FileStorage:
+        return FileStorage(stream=io.BytesIO(content), filename=filename)
+    return make_upload
+
+
+@pytest.fixture
+def random_map():
+    """
+    Fixture that provides a function returning a random map of the given size, mostly walkable.
+    """
+    def make_random_map(rng: random.Random, rows: int, cols: int, walkable: float = 0.85) -> Map:
+        matrix = [[rng.random() < walkable for _ in range(cols)] for _ in range(rows)]
+        return Map.from_matrix(matrix, rows=rows, cols=cols)
+    return make_random_map
+
+
+@pytest.fixture
+def random_path():
+    """
+    Fixture that provides a function returning a random path starting anywhere on a map of the given size,
+    with actions of the given numbers of steps.
+    """
+    def make_random_path(rng: random.Random, rows: int, cols: int, steps: tuple = (0, 1, 2, 3, 5, 20),
+                         max_actions: int = 30) -> RobotPath:
+        actions = [{"direction": rng.choice(["north", "east", "south", "west"]), "steps": rng.choice(steps)}
+                   for _ in range(rng.randint(0, max_actions))]
+        return RobotPath(x=rng.randrange(cols), y=rng.randrange(rows), actions=actions)
+    return make_random_path
+
+
 @pytest.fixture
 def robot(db_connection, map_actions_files):
     """
@@ -1,7 +1,13 @@
 import csv
 import io
+import json
+import threading
 import pytest
+from app.app import robot_registry
+from app.cleaning_robot import BaseCleaningRobot, PremiumCleaningRobot
 from app.database import CleaningSession
+from app.map import Map, BIN_BIT_GRID
+from app.report import decode_runs
 
 
 class TestSetMapEndpoint:
@@ -59,6 +65,17 @@ class TestSetMapEndpoint:
             # Check if the error is handled correctly
             assert response.status_code == 500
 
+    def test_set_map_success_bin(self, client):
+        """
+        Test the /set-map endpoint when uploading a binary map file.
+        """
+        content = Map.from_matrix([[True, True], [False, True]], rows=2, cols=2).to_bin(BIN_BIT_GRID)
+        response = client.post('/set-map', data={'file': (io.BytesIO(content), 'map.bin')})
+
+        # Check if the upload was successful
+        assert response.status_code == 200
+        assert response.json['message'] == 'Map uploaded successfully!'
+
 
 class TestCleanEndpoint:
     def test_clean_no_file(self, client):
@@ -131,6 +148,202 @@ class TestCleanEndpoint:
         assert report['status'] == 'error'
         assert "non-walkable tile" in report['error']
 
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_clean_compact_report(self, client, map_actions_files):
+        map_file, action_file = map_actions_files
+        client.post('/set-map', data={'file': map_file})
+        response = client.post('/clean?format=compact', data={'file': action_file})
+        # Extract the compact cleaning report from the response
+        report = response.get_json().get('report')
+
+        # Check that the runs decode to the full list of cleaned tiles
+        assert response.status_code == 200
+        assert report['status'] == 'error'
+        assert report['cleaned_runs'][0] == [6, 2, 'east', 4]
+        tiles = decode_runs(report['cleaned_runs'])
+        assert len(tiles) == 12
+        assert tiles[-1] == (5, 4)
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_clean_metrics_report(self, client, db_connection, map_actions_files):
+        map_file, action_file = map_actions_files
+        actions = action_file.read()
+        client.post('/set-map', data={'file': map_file})
+        response = client.post('/clean', data={'file': (io.BytesIO(actions), action_file.filename)})
+        expected_report = response.get_json().get('report')
+
+        # Replay the same cleaning session, only measuring it
+        response = client.post('/clean?format=metrics', data={'file': (io.BytesIO(actions), action_file.filename)})
+        metrics = response.get_json().get('metrics')
+
+        assert response.status_code == 200
+        assert (metrics['status'], metrics['error']) == (expected_report['status'], expected_report['error'])
+        assert metrics['cleaned_tiles'] == len(expected_report['cleaned_tiles'])
+        assert metrics['unique_tiles'] == len({tuple(tile) for tile in expected_report['cleaned_tiles']})
+        assert 0 < metrics['coverage'] <= 100
+        sessions = db_connection.session.query(CleaningSession).order_by(CleaningSession.id).all()
+        assert [(s.number_of_actions, s.number_of_cleaned_tiles) for s in sessions] == \
+               [(metrics['path_length'], metrics['cleaned_tiles'])] * 2
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_clean_stream_report(self, client, map_actions_files):
+        map_file, action_file = map_actions_files
+        actions = action_file.read()
+        client.post('/set-map', data={'file': map_file})
+        response = client.post('/clean', data={'file': (io.BytesIO(actions), action_file.filename)})
+        expected_report = response.get_json().get('report')
+
+        # Replay the same cleaning session in streaming mode
+        response = client.post('/clean?format=stream', data={'file': (io.BytesIO(actions), action_file.filename)})
+
+        # Check that the streamed report matches the regular one
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.get_json().get('report') == expected_report
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_clean_stream_report_storage_failure(self, client, map_actions_files, monkeypatch):
+        def fail(*args):
+            raise Exception("Database unavailable")
+
+        # Storing the session fails once the tiles are already sent
+        monkeypatch.setattr(BaseCleaningRobot, '_store_session', fail)
+        map_file, action_file = map_actions_files
+        client.post('/set-map', data={'file': map_file})
+        response = client.post('/clean?format=stream', data={'file': action_file})
+        report = response.get_json().get('report')
+
+        assert response.status_code == 200
+        assert report['status'] == 'error'
+        assert report['error'] == 'Database unavailable'
+        assert report['cleaned_tiles'][0] == [3, 3]
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_clean_premium_stream_report(self, client, map_actions_files):
+        map_file, action_file = map_actions_files
+        client.post('/set-map-premium', data={'file': map_file})
+        response = client.post('/clean-premium?format=stream', data={'file': action_file})
+        report = response.get_json().get('report')
+
+        assert response.status_code == 200
+        assert report['status'] == 'completed'
+        assert report['error'] is None
+        assert report['cleaned_tiles'] == [[3, 3], [3, 2], [2, 2], [2, 1], [3, 1], [4, 1]]
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_clean_without_orjson(self, client, map_actions_files, monkeypatch):
+        # Force the standard library JSON encoder
+        monkeypatch.setattr('app.app.orjson', None)
+        map_file, action_file = map_actions_files
+        client.post('/set-map', data={'file': map_file})
+        response = client.post('/clean', data={'file': action_file})
+        report = response.get_json().get('report')
+
+        assert response.status_code == 200
+        assert report['status'] == 'completed'
+        assert report['cleaned_tiles'][0] == [3, 3]
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_clean_streamed_actions(self, client, map_actions_files, monkeypatch):
+        map_file, action_file = map_actions_files
+        actions = action_file.read()
+        client.post('/set-map', data={'file': map_file})
+        response = client.post('/clean', data={'file': (io.BytesIO(actions), action_file.filename)})
+        expected_report = response.get_json().get('report')
+
+        # Parse the actions while the robot follows them, with the report streamed as well
+        monkeypatch.setattr('app.app.robot_path_config.stream', True)
+        response = client.post('/clean?format=stream', data={'file': (io.BytesIO(actions), action_file.filename)})
+
+        assert response.status_code == 200
+        assert response.get_json().get('report') == expected_report
+
+    def test_clean_streamed_actions_size_limit(self, client, monkeypatch):
+        client.post('/set-map', data={'file': (io.BytesIO(b'ooo'), 'map.txt')})
+        monkeypatch.setattr('app.app.robot_path_config.stream', True)
+        monkeypatch.setattr('app.app.MAX_FILE_SIZE', 64)
+        actions = b'0 0\n' + b'east 0\n' * 20
+
+        # TXT actions are read one line at a time, so they may exceed the limit of the files parsed at once
+        response = client.post('/clean', data={'file': (io.BytesIO(actions), 'actions.txt')})
+        assert response.get_json()['report']['status'] == 'completed'
+
+        # JSON actions are decoded at once, so they keep the limit of the files parsed at once
+        actions = json.dumps({"x": 0, "y": 0, "actions": [{"direction": "east", "steps": 0}] * 20}).encode()
+        response = client.post('/clean', data={'file': (io.BytesIO(actions), 'actions.json')})
+        assert response.status_code == 500
+        assert 'File is too large' in response.get_json()['error']
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_clean_batch(self, client, db_connection, map_actions_files):
+        map_file, action_file = map_actions_files
+        actions = action_file.read()
+        client.post('/set-map', data={'file': map_file})
+        response = client.post('/clean', data={'file': (io.BytesIO(actions), action_file.filename)})
+        expected_report = response.get_json().get('report')
+
+        files = [(io.BytesIO(actions), action_file.filename), (io.BytesIO(b'6 2\nwest 1'), 'actions.txt')]
+        response = client.post('/clean-batch?format=compact', data={'file': files})
+        reports = response.get_json().get('reports')
+
+        assert response.status_code == 200
+        assert decode_runs(reports[0]['cleaned_runs']) == [tuple(tile) for tile in expected_report['cleaned_tiles']]
+        assert reports[1] == {'cleaned_runs': [[6, 2, 'west', 1]], 'status': 'completed', 'error': None}
+        assert db_connection.session.query(CleaningSession).count() == 3
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_clean_batch_without_persisting(self, client, db_connection, map_actions_files):
+        map_file, action_file = map_actions_files
+        client.post('/set-map', data={'file': map_file})
+        response = client.post('/clean-batch?persist=false', data={'file': [action_file]})
+
+        assert response.status_code == 200
+        assert len(response.get_json().get('reports')) == 1
+        db_connection.ensure_schema()
+        assert db_connection.session.query(CleaningSession).count() == 0
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_clean_batch_metrics(self, client, map_actions_files):
+        map_file, action_file = map_actions_files
+        client.post('/set-map', data={'file': map_file})
+        files = [(io.BytesIO(b'6 2\neast 1\nwest 2\neast 1'), 'actions.txt')]
+        response = client.post('/clean-batch?format=metrics&persist=false', data={'file': files})
+
+        assert response.status_code == 200
+        metrics = response.get_json().get('metrics')
+        assert len(metrics) == 1
+        assert (metrics[0]['cleaned_tiles'], metrics[0]['unique_tiles'], metrics[0]['revisits'],
+                metrics[0]['path_length']) == (5, 3, 2, 4)
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_clean_batch_invalid_file(self, client, map_actions_files):
+        map_file, action_file = map_actions_files
+        client.post('/set-map', data={'file': map_file})
+        files = [action_file, (io.BytesIO(b'6 2\nup 1'), 'invalid.txt')]
+        response = client.post('/clean-batch', data={'file': files})
+
+        assert response.status_code == 500
+        assert response.json['error'].startswith('invalid.txt: ')
+
+        response = client.post('/clean-batch?format=stream', data={'file': (io.BytesIO(b'0 0'), 'actions.txt')})
+        assert response.status_code == 400
+
+    def test_clean_unsupported_report_format(self, client):
+        response = client.post('/clean?format=xml', data={'file': (io.BytesIO(b'0 0'), 'actions.txt')})
+        assert response.status_code == 400
+        assert 'Unsupported report format' in response.json['error']
+
     def test_history_endpoint_success(self, client, db_connection, valid_cleaning_session):
         """Test the /history endpoint for returning a valid CSV response."""
         # Insert the valid session into the database
@@ -140,6 +353,7 @@ class TestCleanEndpoint:
         response = client.get('/history')
         # Check that the response is successful
         assert response.status_code == 200
+        assert response.is_streamed
         assert 'text/csv' in response.content_type
 
         csv_content = io.StringIO(response.data.decode())
@@ -163,6 +377,49 @@ class TestCleanEndpoint:
         data_row = rows[1]
         assert data_row == expected_values, f"Data mismatch: {data_row} != {expected_values}"
 
+    def test_history_endpoint_filters(self, client, db_connection, valid_cleaning_session):
+        """Test the /history endpoint filters and their validation."""
+        db_connection.create_table()
+        db_connection.save_session(valid_cleaning_session)
+
+        response = client.get('/history?state=completed&start=2025-02-06T10:00:00&limit=10')
+        rows = list(csv.reader(io.StringIO(response.data.decode())))
+        assert response.status_code == 200
+        assert len(rows) == 2
+
+        response = client.get('/history?state=error')
+        rows = list(csv.reader(io.StringIO(response.data.decode())))
+        assert response.status_code == 200
+        assert len(rows) == 1
+
+        response = client.get('/history?limit=0')
+        assert response.status_code == 400
+
+        # A misspelled filter is rejected instead of returning the whole history
+        response = client.get('/history?stat=error')
+        assert response.status_code == 400
+        assert 'Invalid history filters' in response.json['error']
+
+    def test_history_stats_endpoint(self, client, db_connection, valid_cleaning_session):
+        """Test the /history/stats endpoint for returning the aggregate statistics."""
+        db_connection.create_table()
+        db_connection.save_session(valid_cleaning_session)
+
+        response = client.get('/history/stats?bucket=hour')
+        assert response.status_code == 200
+        stats = response.get_json()
+        assert stats['bucket'] == 'hour'
+        assert stats['stats'][0]['period'] == '2025-02-06T10:00:00'
+        assert stats['totals']['sessions'] == 1
+        assert stats['totals']['error_rate'] == 0
+
+        response = client.get('/history/stats?bucket=year')
+        assert response.status_code == 400
+
+        for query in ('stat=error', 'limit=10'):
+            response = client.get(f'/history/stats?bucket=hour&{query}')
+            assert response.status_code == 400
+
     def test_history_endpoint_error_no_table(self, client, db_connection, valid_cleaning_session):
         response = client.get('/history')
         assert response.status_code == 500
@@ -171,3 +428,88 @@ class TestCleanEndpoint:
         db_connection.create_table()
         response = client.get('/history')
         assert response.status_code == 500
+
+
+class TestRobotsEndpoints:
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_robots_are_independent(self, client, map_actions_files):
+        map_file, action_file = map_actions_files
+        actions = action_file.read()
+        response = client.post('/robots/r1/set-map', data={'file': map_file})
+        assert response.status_code == 200
+        response = client.post('/robots/r2/set-map?type=premium',
+                               data={'file': (io.BytesIO(b'xxxxx\nxxxxx\nxxxxx\nxxxxx\nxxxxx'), 'map.txt')})
+        assert response.status_code == 200
+
+        # The robot with the walkable map completes its session, the other one cannot even start
+        response = client.post('/robots/r1/clean', data={'file': (io.BytesIO(actions), action_file.filename)})
+        assert response.get_json()['report']['status'] == 'completed'
+        response = client.post('/robots/r2/clean', data={'file': (io.BytesIO(actions), action_file.filename)})
+        assert response.get_json()['report']['error'] == 'Invalid starting position (3, 3).'
+
+    def test_unknown_robot(self, client):
+        response = client.post('/robots/unknown/clean', data={'file': (io.BytesIO(b'0 0'), 'actions.txt')})
+        assert response.status_code == 404
+
+        response = client.delete('/robots/unknown')
+        assert response.status_code == 404
+
+    def test_unsupported_robot_type(self, client):
+        response = client.post('/robots/r1/set-map?type=deluxe', data={'file': (io.BytesIO(b'ooo'), 'map.txt')})
+        assert response.status_code == 400
+        assert 'Unsupported robot type' in response.json['error']
+
+    def test_map_upload_without_type(self, client):
+        client.post('/robots/kept-type/set-map?type=premium', data={'file': (io.BytesIO(b'ooo'), 'map.txt')})
+        robot = robot_registry.get('kept-type').robot
+        response = client.post('/robots/kept-type/set-map', data={'file': (io.BytesIO(b'oo'), 'map.txt')})
+
+        assert response.status_code == 200
+        # The premium robot is kept with the new map rather than replaced by a base robot
+        assert robot_registry.get('kept-type').robot is robot
+        assert isinstance(robot, PremiumCleaningRobot) and robot.map.cols == 2
+
+    def test_failed_map_upload(self, client):
+        response = client.post('/robots/failed/set-map', data={'file': (io.BytesIO(b'oxz'), 'map.txt')})
+        assert response.status_code == 500
+        # No robot is created for an invalid map
+        response = client.post('/robots/failed/clean', data={'file': (io.BytesIO(b'0 0'), 'actions.txt')})
+        assert response.status_code == 404
+
+        # An invalid map of another type leaves the registered robot and its map in place
+        client.post('/robots/kept/set-map', data={'file': (io.BytesIO(b'ooo'), 'map.txt')})
+        response = client.post('/robots/kept/set-map?type=premium', data={'file': (io.BytesIO(b'oxz'), 'map.txt')})
+        assert response.status_code == 500
+        response = client.post('/robots/kept/clean', data={'file': (io.BytesIO(b'0 0\neast 2'), 'actions.txt')})
+        assert response.get_json()['report']['status'] == 'completed'
+
+    def test_remove_robot(self, client):
+        client.post('/robots/removed/set-map', data={'file': (io.BytesIO(b'ooo'), 'map.txt')})
+        response = client.delete('/robots/removed')
+        assert response.status_code == 200
+
+        response = client.post('/robots/removed/clean', data={'file': (io.BytesIO(b'0 0'), 'actions.txt')})
+        assert response.status_code == 404
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_concurrent_sessions_of_one_robot(self, app, client, map_actions_files):
+        map_file, action_file = map_actions_files
+        actions = action_file.read()
+        client.post('/robots/shared/set-map?type=premium', data={'file': map_file})
+
+        def clean(results):
+            response = app.test_client().post('/robots/shared/clean',
+                                              data={'file': (io.BytesIO(actions), action_file.filename)})
+            results.append(len(response.get_json()['report']['cleaned_tiles']))
+
+        results = []
+        threads = [threading.Thread(target=clean, args=(results,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Serialized premium sessions alternate between cleaning every tile and cleaning none of them
+        assert sorted(results) == [0] * 4 + [6] * 4
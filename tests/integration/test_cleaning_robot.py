@@ -4,8 +4,13 @@ import os
 
 import pytest
 import json
+from werkzeug.datastructures import FileStorage
 
+from app.cleaning_robot import PremiumCleaningRobot
 from app.database import CleaningSession
+from app.report import CleaningReport
+from app.robot_path import RobotPath
+from app.simulation_pool import SimulationPool, SimulationPoolConfig
 
 
 class TestCleaningRobot:
@@ -20,9 +25,9 @@ class TestCleaningRobot:
         """
         Test that the clean method completes successfully with a valid map and path.
         """
-        report = json.loads(robot.clean())
-        assert report["status"] == "completed"
-        assert "error" in report and report["error"] is None
+        report = robot.clean()
+        assert report.status == "completed"
+        assert report.error is None
 
     @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_2.txt",
                                                     "actions/valid_data/txt/actions_2.txt")], indirect=True)
@@ -30,9 +35,19 @@ class TestCleaningRobot:
         """
         Test that the clean method returns an error when the robot moves out of bounds.
         """
-        report = json.loads(robot.clean())
-        assert report["status"] == "error"
-        assert "out of map bounds" in report["error"]
+        report = robot.clean()
+        assert report.status == "error"
+        assert "out of map bounds" in report.error
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_2.txt",
+                                                    "actions/valid_data/txt/actions_2.txt")], indirect=True)
+    def test_clean_out_of_bounds_report(self, robot):
+        """
+        Test that the report stops at the last tile inside the map and names the out of bounds tile.
+        """
+        report = robot.clean()
+        assert report.cleaned_tiles == [(4, 3), (5, 3), (6, 3), (7, 3)]
+        assert report.error == "Robot moved out of map bounds at (8, 3)."
 
     @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
                                                     "actions/valid_data/txt/actions_3.txt")], indirect=True)
@@ -40,7 +55,177 @@ class TestCleaningRobot:
         """
         Test that the clean method returns an error when the robot moves to a non-walkable tile.
         """
-        report = json.loads(robot.clean())
+        report = robot.clean()
         print(report)
-        assert report["status"] == "error"
-        assert "non-walkable tile" in report["error"]
+        assert report.status == "error"
+        assert "non-walkable tile" in report.error
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_clean_non_walkable_tile_report(self, robot):
+        """
+        Test that the report stops at the last walkable tile and names the non-walkable tile.
+        """
+        report = robot.clean()
+        assert len(report.cleaned_tiles) == 12
+        assert report.cleaned_tiles[-1] == (5, 4)
+        assert report.error == "Robot attempted to move to a non-walkable tile at (4, 4)."
+
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_interrupted_stream_stored(self, robot):
+        """
+        Test that a session whose tiles stop being consumed is still stored, with an error status.
+        """
+        report = CleaningReport.build([], status="completed")
+        tiles = robot.clean_stream(report)
+        next(tiles)
+        tiles.close()
+
+        assert report.status == "error"
+        sessions = robot.database_conn.session.query(CleaningSession).all()
+        assert [session.session_final_state for session in sessions] == ["error"]
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_failed_stream_stored(self, robot, monkeypatch):
+        """
+        Test that a session failing with an unexpected exception is re-raised and stored with an error status.
+        """
+        def fail(x, y):
+            raise RuntimeError("Unexpected failure.")
+            yield
+
+        monkeypatch.setattr(robot, "_visit_path", fail)
+        report = CleaningReport.build([], status="completed")
+        with pytest.raises(RuntimeError):
+            list(robot.clean_stream(report))
+
+        assert (report.status, report.error) == ("error", "Unexpected failure.")
+        sessions = robot.database_conn.session.query(CleaningSession).all()
+        assert [session.session_final_state for session in sessions] == ["error"]
+
+
+class TestCleaningRobotPathStream:
+    """
+    Test suite for the CleaningRobot's clean method with actions parsed while the robot follows them.
+    Covers the same report as a loaded path and malformed actions reached during the session.
+    """
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_3.txt",
+                                                    "actions/valid_data/txt/actions_3.txt")], indirect=True)
+    def test_same_report_as_loaded_path(self, robot, map_actions_files):
+        """
+        Test that a streamed path produces the same report as the loaded path.
+        """
+        _, action_file = map_actions_files
+        report = robot.clean()
+
+        action_file.stream.seek(0)
+        robot.path = RobotPath.stream(action_file)
+        assert robot.clean() == report
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_malformed_action_ends_session(self, robot):
+        """
+        Test that a malformed action ends the session with an error, after cleaning the tiles of the previous actions.
+        """
+        robot.path = RobotPath.stream(FileStorage(stream=io.BytesIO(b"3 3\neast 2\nwest two\n"),
+                                                  filename="actions.txt"))
+        report = robot.clean()
+
+        assert report.cleaned_tiles == [(3, 3), (4, 3), (5, 3)]
+        assert report.status == "error"
+        assert report.error.startswith("Failed to load actions from TXT")
+
+
+class TestCleaningRobotBatch:
+    """
+    Test suite for the CleaningRobot's clean_batch method.
+    Covers the reports of the batch and the storage of its sessions.
+    """
+
+    PATHS = [RobotPath(x=3, y=3, actions=[{"direction": "east", "steps": 2}]),
+             RobotPath(x=3, y=3, actions=[{"direction": "east", "steps": 20}]),
+             RobotPath(x=0, y=0, actions=[])]
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_same_reports_as_clean(self, robot):
+        """
+        Test that the batch reports match the reports of one clean() call per path.
+        """
+        expected_reports = []
+        for path in self.PATHS:
+            robot.path = path
+            expected_reports.append(robot.clean())
+
+        assert robot.clean_batch(self.PATHS) == expected_reports
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_sessions_stored_together(self, robot):
+        """
+        Test that every session of the batch is stored, and that none is stored when storing is disabled.
+        """
+        robot.clean_batch(self.PATHS, store=False)
+        robot.database_conn.ensure_schema()
+        assert robot.database_conn.session.query(CleaningSession).count() == 0
+
+        robot.clean_batch(self.PATHS)
+        states = [row.session_final_state for row in
+                  robot.database_conn.session.query(CleaningSession).order_by(CleaningSession.id)]
+        assert states == ["completed", "error", "error"]
+
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_parallel_batch(self, robot):
+        """
+        Test that a batch simulated by a pool of processes gives the same reports and stores every session,
+        and that a premium robot, whose sessions depend on each other, does not use the pool.
+        """
+        expected_reports = robot.clean_batch(self.PATHS, store=False)
+        pool = SimulationPool(SimulationPoolConfig(enabled=True, max_workers=2, min_batch_size=1))
+        try:
+            assert robot.clean_batch(self.PATHS, pool=pool) == expected_reports
+            assert robot.database_conn.session.query(CleaningSession).count() == len(self.PATHS)
+
+            premium_robot = PremiumCleaningRobot(map=robot.map, database_conn=robot.database_conn)
+            reports = premium_robot.clean_batch([self.PATHS[0], self.PATHS[0]], store=False, pool=pool)
+            assert reports[1].cleaned_tiles == []
+        finally:
+            pool.close()
+
+
+class TestPremiumCleaningRobot:
+    """
+    Test suite for the PremiumCleaningRobot's clean method.
+    Covers deduplication of tiles within a session and across consecutive sessions.
+    """
+
+    @pytest.mark.parametrize("map_actions_files", [("maps/valid_data/txt/map_1.txt",
+                                                    "actions/valid_data/txt/actions_1.txt")], indirect=True)
+    def test_clean_skips_already_cleaned_tiles(self, robot):
+        """
+        Test that each tile is reported once per session, in the order it was first cleaned,
+        and that tiles cleaned in the previous session are not cleaned again.
+        """
+        path = RobotPath(x=3, y=3, actions=[{"direction": "east", "steps": 2},
+                                            {"direction": "west", "steps": 4},
+                                            {"direction": "east", "steps": 1}])
+        premium_robot = PremiumCleaningRobot(map=robot.map, path=path, database_conn=robot.database_conn)
+
+        report = premium_robot.clean()
+        assert report.cleaned_tiles == [(3, 3), (4, 3), (5, 3), (2, 3), (1, 3)]
+        assert report.status == "completed"
+
+        # The second session repeats the same path, so every tile was cleaned in the previous one
+        report = premium_robot.clean()
+        assert report.cleaned_tiles == []
+
+        # The third session only remembers the second one, which cleaned nothing
+        report = premium_robot.clean()
+        assert len(report.cleaned_tiles) == 5
@@ -1,7 +1,10 @@
+import io
 import json
 import sys
 import os
 import pytest
+from pydantic import ValidationError
+from werkzeug.datastructures import FileStorage
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from app.robot_path import RobotPath  # Update with the actual module name
@@ -117,3 +120,127 @@ class TestInvalidRobotPathData:
             # Assert that a ValueError was raised
             assert e.type == ValueError
             print(f"Error: {e.value}")
+
+
+class TestCompactActions:
+    """
+    Test the array-backed storage of the robot path actions.
+
+    This class contains tests to verify that the actions are stored as direction codes and step counts,
+    that the actions view rebuilds the same actions, and that invalid actions are still rejected.
+    """
+
+    def test_actions_view(self):
+        """
+        Test that the actions view rebuilds the given actions, in order, from the direction codes and step counts.
+        """
+        actions = [{"direction": "north", "steps": 3}, RobotPath.Action(direction="west", steps=0),
+                   {"direction": "east", "steps": "2"}]
+        robot_path = RobotPath(x=1, y=2, actions=actions)
+
+        assert list(robot_path.iter_moves()) == [(0, 3), (3, 0), (1, 2)]
+        assert len(robot_path.actions) == 3
+        assert robot_path.actions[-1] == RobotPath.Action(direction="east", steps=2)
+        assert robot_path.actions == [RobotPath.Action(direction="north", steps=3),
+                                      RobotPath.Action(direction="west", steps=0),
+                                      RobotPath.Action(direction="east", steps=2)]
+
+    def test_serialization(self):
+        """
+        Test that the actions are still part of the dumped model and of its JSON schema.
+        """
+        robot_path = RobotPath(x=1, y=2, actions=[{"direction": "north", "steps": 3}])
+        data = {"x": 1, "y": 2, "actions": [{"direction": "north", "steps": 3}]}
+
+        assert robot_path.model_dump() == data
+        assert RobotPath.model_validate_json(robot_path.model_dump_json()) == robot_path
+        assert "actions" in RobotPath.model_json_schema()["properties"]
+
+    @pytest.mark.parametrize("data", [
+        {"x": 1, "y": 2, "actions": [{"direction": "up", "steps": 1}]},
+        {"x": 1, "y": 2, "actions": [{"direction": "north", "steps": -1}]},
+        {"x": 1, "y": 2, "actions": [{"direction": "north"}]},
+        {"x": 1, "y": 2, "actions": None},
+        {"x": 1, "y": 2},
+        {"x": -1, "y": 2, "actions": []},
+    ])
+    def test_invalid_actions_raise(self, data: dict):
+        """
+        Test that invalid paths still raise the validation error of the path.
+        """
+        with pytest.raises(ValidationError, match="validation error for RobotPath"):
+            RobotPath(**data)
+
+    def test_steps_beyond_steps_array_raise_on_load(self, upload):
+        """
+        Test that a JSON action with more steps than the steps array holds raises the load error of the file.
+        """
+        content = json.dumps({"x": 0, "y": 0, "actions": [{"direction": "north", "steps": 2 ** 64}]}).encode()
+        with pytest.raises(ValueError, match="Failed to load actions from JSON: Number of steps"):
+            RobotPath.load(upload(content, "actions.json"))
+
+
+class TestRobotPathStream:
+    """
+    Test the lazy loading of robot path data from TXT and JSON files.
+
+    This class contains tests to verify that streamed paths yield the same actions as loaded paths,
+    and that malformed actions are only reported when they are reached.
+    """
+
+    @pytest.mark.parametrize("files", ["actions/valid_data/txt", "actions/valid_data/json"], indirect=True)
+    def test_same_actions_as_load(self, files: list):
+        """
+        Test that a streamed path has the same starting position and actions as the loaded one.
+
+        Args: List of valid robot path data.
+        """
+        for file in files:
+            robot_path = RobotPath.load(file)
+            file.stream.seek(0)
+            robot_path_stream = RobotPath.stream(file)
+
+            assert (robot_path_stream.x, robot_path_stream.y) == (robot_path.x, robot_path.y)
+            assert list(robot_path_stream.actions) == robot_path.actions
+
+    def test_txt_actions_read_on_iteration(self):
+        """
+        Test that the action lines of a TXT file are only read while the actions are iterated.
+        """
+        stream = io.BytesIO(b"1 2\nnorth 3\nEAST 1\n")
+        robot_path = RobotPath.stream(FileStorage(stream=stream, filename="actions.txt"))
+        assert (robot_path.x, robot_path.y) == (1, 2)
+        assert stream.tell() == len(b"1 2\n")
+
+        actions = iter(robot_path.actions)
+        assert next(actions) == RobotPath.Action(direction="north", steps=3)
+        assert stream.tell() == len(b"1 2\nnorth 3\n")
+        assert next(actions) == RobotPath.Action(direction="east", steps=1)
+
+    @pytest.mark.parametrize("content, filename", [
+        (b"1 2\nnorth 3\nup 1\n", "actions.txt"),
+        (b"1 2\nnorth 3\n\n", "actions.txt"),
+        (b'{"x": 1, "y": 2, "actions": [{"direction": "north", "steps": 3}, {"direction": "north"}]}', "actions.json"),
+    ])
+    def test_malformed_action_raises_when_reached(self, content: bytes, filename: str):
+        """
+        Test that the actions before a malformed one are yielded, and that the malformed one raises a ValueError.
+        """
+        actions = iter(RobotPath.stream(FileStorage(stream=io.BytesIO(content), filename=filename)).actions)
+        assert next(actions) == RobotPath.Action(direction="north", steps=3)
+        with pytest.raises(ValueError, match="Failed to load actions"):
+            next(actions)
+
+    @pytest.mark.parametrize("content, filename", [
+        (b"1\nnorth 3\n", "actions.txt"),
+        (b'{"x": -1, "y": 2, "actions": []}', "actions.json"),
+        (b'{"x": 1, "y": 2, "actions": {}}', "actions.json"),
+        (b'[1, 2]', "actions.json"),
+        (b'1 2\n', "actions.xml"),
+    ])
+    def test_malformed_start_raises_on_load(self, content: bytes, filename: str):
+        """
+        Test that a malformed starting position or document raises a ValueError before any action is parsed.
+        """
+        with pytest.raises(ValueError):
+            RobotPath.stream(FileStorage(stream=io.BytesIO(content), filename=filename))
@@ -0,0 +1,46 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from app.cleaned_tiles import CleanedTiles
+
+
+class TestCleanedTiles:
+    """
+    Test the insertion-ordered cleaned tiles set.
+
+    This class contains tests to verify that tiles are deduplicated through the bitmap
+    while the order in which they were first cleaned is preserved.
+    """
+
+    def test_add_keeps_insertion_order(self):
+        """
+        Test that tiles are returned in the order they were first added, without duplicates.
+        """
+        cleaned_tiles = CleanedTiles(rows=3, cols=4)
+        for tile in [(1, 1), (2, 1), (1, 1), (0, 2), (2, 1), (3, 0)]:
+            cleaned_tiles.add(tile)
+
+        assert cleaned_tiles.tiles == [(1, 1), (2, 1), (0, 2), (3, 0)]
+        assert list(cleaned_tiles) == cleaned_tiles.tiles
+        assert len(cleaned_tiles) == 4
+
+    def test_add_reports_new_tiles(self):
+        """
+        Test that add returns True only the first time a tile is cleaned.
+        """
+        cleaned_tiles = CleanedTiles(rows=2, cols=2)
+        assert cleaned_tiles.add((1, 0)) is True
+        assert cleaned_tiles.add((1, 0)) is False
+
+    def test_contains(self):
+        """
+        Test membership of cleaned, not cleaned and out of bounds tiles.
+        """
+        cleaned_tiles = CleanedTiles(rows=2, cols=3)
+        cleaned_tiles.add((2, 1))
+
+        assert (2, 1) in cleaned_tiles
+        assert (1, 2) not in cleaned_tiles
+        assert (5, 5) not in cleaned_tiles
+        assert (0, 0) not in CleanedTiles()
@@ -1,8 +1,10 @@
 import csv
 import io
 import os
+from datetime import datetime, timedelta
 import sys
 import tempfile
+import threading
 import time
 
 import pytest
@@ -10,7 +12,8 @@ from sqlalchemy import inspect
 from sqlalchemy.exc import IntegrityError
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from app.database import CleaningSession, Base
+import app.database
+from app.database import CleaningSession, Base, Database, HistoryFilter, WriteBehindConfig
 
 
 class TestDatabaseMethods:
@@ -19,6 +22,20 @@ class TestDatabaseMethods:
         db_connection.create_table()
         assert db_connection.session.query(CleaningSession).count() == 0  # Table exists but is empty
 
+    def test_ensure_schema_runs_once(self, db_connection, monkeypatch):
+        """Test that the schema is created once and then only the cached schema state is checked."""
+        db_connection.ensure_schema()
+        assert CleaningSession.__tablename__ in inspect(db_connection.engine).get_table_names()
+
+        # Any further catalog access would now fail
+        def fail(*args, **kwargs):
+            raise AssertionError("The schema should not be checked again")
+        monkeypatch.setattr(Base.metadata, 'create_all', fail)
+        monkeypatch.setattr('app.database.inspect', fail)
+        db_connection.ensure_schema()
+        with pytest.raises(Exception, match="There are no past cleaning sessions"):
+            db_connection.get_history()
+
     def test_save_valid_session(self, db_connection, valid_cleaning_session):
         """Test inserting a valid CleaningSession into the database."""
         db_connection.create_table()
@@ -60,6 +77,168 @@ class TestDatabaseMethods:
         data_row = rows[1]
         assert data_row == expected_values, f"Data mismatch: {data_row} != {expected_values}"
 
+    def test_connect_reuses_connection_pool(self, db_connection):
+        """Test that connecting again returns the same instance, sharing the configured connection pool."""
+        config = db_connection.config
+        assert Database.connect(config) is db_connection
+        assert db_connection.engine.pool.size() == config.pool_size
+
+    def test_session_per_thread(self, db_connection, valid_cleaning_session):
+        """Test that each thread gets its own session and that concurrent inserts are all stored."""
+        db_connection.create_table()
+        sessions = []
+
+        def save():
+            sessions.append(db_connection.session())
+            db_connection.save_session(self._session(valid_cleaning_session))
+            db_connection.close()
+
+        threads = [threading.Thread(target=save) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(set(map(id, sessions))) == 4
+        assert db_connection.session.query(CleaningSession).count() == 4
+
+    def test_save_sessions_batch(self, db_connection, valid_cleaning_session, invalid_cleaning_session):
+        """Test that a batch of sessions is saved in a single transaction."""
+        db_connection.create_table()
+        db_connection.save_sessions([valid_cleaning_session, self._session(valid_cleaning_session)])
+        assert db_connection.session.query(CleaningSession).count() == 2
+
+        # A single invalid session rolls back the whole batch
+        with pytest.raises(Exception):
+            db_connection.save_sessions([self._session(valid_cleaning_session), invalid_cleaning_session])
+        assert db_connection.session.query(CleaningSession).count() == 2
+
+    def test_write_behind(self, db_connection, valid_cleaning_session):
+        """Test that submitted sessions are queued and saved in batches by the background writer."""
+        db_connection.create_table()
+        db_connection.enable_write_behind(WriteBehindConfig(batch_size=4, flush_interval=0.05))
+        try:
+            for _ in range(10):
+                db_connection.submit_session(self._session(valid_cleaning_session))
+            db_connection._writer.flush()
+            assert db_connection.session.query(CleaningSession).count() == 10
+        finally:
+            db_connection.disable_write_behind()
+
+    def test_write_behind_flushes_on_close(self, db_connection, valid_cleaning_session):
+        """Test that closing the writer saves the sessions still waiting in the queue."""
+        db_connection.create_table()
+        db_connection.enable_write_behind(WriteBehindConfig(flush_interval=10))
+        for _ in range(3):
+            db_connection.submit_session(self._session(valid_cleaning_session))
+        db_connection.disable_write_behind()
+        assert db_connection.session.query(CleaningSession).count() == 3
+
+    def test_write_behind_started_once(self, db_connection, monkeypatch):
+        """Test that concurrent requests enabling write-behind persistence start a single writer."""
+        writers = []
+        writer_class = app.database.SessionWriter
+
+        def start_writer(*args):
+            # Widen the window between the check and the start of the writer
+            time.sleep(0.01)
+            writers.append(writer_class(*args))
+            return writers[-1]
+
+        monkeypatch.setattr(app.database, "SessionWriter", start_writer)
+        threads = [threading.Thread(target=db_connection.enable_write_behind, args=(WriteBehindConfig(),))
+                   for _ in range(4)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert len(writers) == 1
+        finally:
+            db_connection.disable_write_behind()
+
+    @staticmethod
+    def _session(template):
+        """Returns a new CleaningSession with the same values as the given one."""
+        return CleaningSession(
+            session_start_time=template.session_start_time,
+            session_final_state=template.session_final_state,
+            number_of_actions=template.number_of_actions,
+            number_of_cleaned_tiles=template.number_of_cleaned_tiles,
+            duration=template.duration
+        )
+
+    def test_iter_history_chunks(self, db_connection, valid_cleaning_session):
+        """Test that the history is produced one chunk of rows at a time, in insertion order."""
+        db_connection.create_table()
+        db_connection.save_sessions([self._session(valid_cleaning_session) for _ in range(5)])
+
+        chunks = list(db_connection.iter_history(chunk_size=2))
+        assert len(chunks) == 3
+
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        assert rows[0] == [column.name for column in CleaningSession.__table__.columns]
+        assert [row[0] for row in rows[1:]] == ['1', '2', '3', '4', '5']
+
+    def test_create_table_indexes(self, db_connection):
+        """Test that the history indexes are created with the table."""
+        db_connection.create_table()
+        indexes = {index['name'] for index in inspect(db_connection.engine).get_indexes(CleaningSession.__tablename__)}
+        assert {'ix_cleaning_sessions_start_time', 'ix_cleaning_sessions_final_state_start_time'} <= indexes
+
+    def test_iter_history_filters(self, db_connection, valid_cleaning_session):
+        """Test the time range, final state and keyset pagination filters of the history."""
+        db_connection.create_table()
+        start = datetime(2025, 2, 6, 10, 0, 0)
+        sessions = []
+        for minute in range(6):
+            session = self._session(valid_cleaning_session)
+            session.session_start_time = start + timedelta(minutes=minute)
+            session.session_final_state = "error" if minute % 2 else "completed"
+            sessions.append(session)
+        db_connection.save_sessions(sessions)
+
+        def ids(**filters):
+            rows = list(csv.reader(io.StringIO(''.join(db_connection.iter_history(HistoryFilter(**filters))))))
+            return [int(row[0]) for row in rows[1:]]
+
+        assert ids(start=start + timedelta(minutes=2), end=start + timedelta(minutes=4)) == [3, 4]
+        assert ids(state="error") == [2, 4, 6]
+        assert ids(limit=2) == [1, 2]
+        assert ids(after_id=2, limit=2) == [3, 4]
+        assert ids(state="error", after_id=4) == [6]
+        # An empty page is a header-only CSV, not an error
+        assert ids(after_id=6) == []
+
+    def test_get_stats(self, db_connection, valid_cleaning_session):
+        """Test the aggregate statistics of the history, per day."""
+        db_connection.create_table()
+        sessions = []
+        for day, state, actions, tiles, minutes in [(6, "completed", 10, 20, 10), (6, "error", 10, 5, 20),
+                                                    (7, "completed", 30, 30, 30)]:
+            session = self._session(valid_cleaning_session)
+            session.session_start_time = datetime(2025, 2, day, 12, 0, 0)
+            session.session_final_state = state
+            session.number_of_actions = actions
+            session.number_of_cleaned_tiles = tiles
+            session.duration = timedelta(minutes=minutes)
+            sessions.append(session)
+        db_connection.save_sessions(sessions)
+
+        stats = db_connection.get_stats(bucket="day")
+        assert [day["period"] for day in stats["stats"]] == ["2025-02-06T00:00:00", "2025-02-07T00:00:00"]
+        first_day = stats["stats"][0]
+        assert first_day["sessions"] == 2
+        assert first_day["error_rate"] == 0.5
+        assert first_day["mean_duration"] == 900
+        assert first_day["tiles_per_action"] == 1.25
+        assert stats["totals"]["sessions"] == 3
+        assert stats["totals"]["mean_duration"] == 1200
+
+        stats = db_connection.get_stats(HistoryFilter(state="error"), bucket="month")
+        assert stats["totals"]["sessions"] == 1
+        assert stats["totals"]["error_rate"] == 1
+
     def test_cleanup(self, db_connection):
         """Ensure the database session is properly cleaned after the test."""
         inspector = inspect(db_connection.session.bind)
@@ -1,10 +1,11 @@
 import json
+import random
 import sys
 import os
 import pytest
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from app.map import Map
+from app.map import Map, BIN_BIT_GRID, BIN_BYTE_GRID
 
 
 class TestValidMapData:
@@ -103,3 +104,260 @@ class TestInvalidMapData:
             # Assert that a ValueError was raised
             assert e.type == ValueError
             print(f"Error: {e.value}")
+
+
+class TestCompactGrid:
+    """
+    Test the compact grid representation of the map.
+
+    This class contains tests to verify that the map stores one byte per tile
+    and that building it from a boolean matrix keeps the same walkability.
+    """
+
+    @pytest.mark.parametrize("files", ["maps/valid_data/txt"], indirect=True)
+    def test_one_byte_per_tile(self, files: list):
+        """
+        Test that loaded maps store exactly one byte per tile.
+
+        Args: files (list): Valid text map data for testing.
+        """
+        for file in files:
+            map = Map.load(file)
+            assert isinstance(map.grid, bytes)
+            assert len(map.grid) == map.rows * map.cols
+
+    def test_from_matrix(self):
+        """
+        Test that a map built from a boolean matrix keeps the walkability of every tile.
+        """
+        matrix = [[True, False, True], [False, True, True]]
+        map = Map.from_matrix(matrix, rows=2, cols=3)
+
+        for y in range(map.rows):
+            for x in range(map.cols):
+                assert map.is_walkable(x, y) == matrix[y][x]
+        assert map.walkable_tiles == 4
+
+    def test_from_matrix_dimension_mismatch(self):
+        """
+        Test that building a map from a matrix with wrong dimensions raises a ValueError.
+        """
+        with pytest.raises(ValueError):
+            Map.from_matrix([[True, False], [True]], rows=2, cols=2)
+        with pytest.raises(ValueError):
+            Map.from_matrix([[True, False]], rows=2, cols=2)
+
+    def test_grid_size_mismatch(self):
+        """
+        Test that a grid whose size does not match rows × cols raises a ValueError.
+        """
+        with pytest.raises(ValueError):
+            Map(grid=b'\x01\x00\x01', rows=2, cols=2)
+
+
+class TestJSONFastPath:
+    """
+    Test the fast path that builds the grid of well-formed JSON maps.
+
+    This class contains tests to verify that the fast path builds the same grid as the
+    Pydantic validation, and that malformed maps still fail with the validation errors.
+    """
+
+    def test_same_grid_as_validation(self, upload):
+        """
+        Test that the fast path and the Pydantic validation build the same grid on random maps.
+        """
+        rng = random.Random(0)
+        for _ in range(20):
+            rows, cols = rng.randint(1, 12), rng.randint(1, 12)
+            tiles = [{"x": x, "y": y, "walkable": rng.random() < 0.7} for y in range(rows) for x in range(cols)]
+            rng.shuffle(tiles)
+            content = json.dumps({"rows": rows, "cols": cols, "tiles": tiles}).encode()
+            fast = Map.load(upload(content, "map.json"))
+
+            # Integer walkability is coerced by Pydantic only, so it forces the validation path
+            coerced = [dict(tile, walkable=int(tile["walkable"])) for tile in tiles]
+            content = json.dumps({"rows": rows, "cols": cols, "tiles": coerced}).encode()
+            validated = Map.load(upload(content, "map.json"))
+
+            assert fast.grid == validated.grid
+
+    @pytest.mark.parametrize("data", [
+        {"rows": 1, "cols": 2, "tiles": [{"x": 0, "y": 0, "walkable": True}, {"x": 0, "y": 0, "walkable": True}]},
+        {"rows": 1, "cols": 2, "tiles": [{"x": 0, "y": 0, "walkable": True}, {"x": 2, "y": 0, "walkable": True}]},
+        {"rows": 1, "cols": 2, "tiles": [{"x": 0, "y": 0, "walkable": True}]},
+        {"rows": 1, "cols": 1, "tiles": [{"x": 0, "y": 0, "walkable": "maybe"}]},
+        {"rows": 0, "cols": 1, "tiles": []},
+        {"rows": 1, "cols": 1},
+    ])
+    def test_malformed_maps_raise(self, upload, data: dict):
+        """
+        Test that malformed JSON maps still raise a ValueError from the validation.
+        """
+        with pytest.raises(ValueError, match="Failed to load map from JSON"):
+            Map.load(upload(json.dumps(data).encode(), "map.json"))
+
+
+class TestTXTFastPath:
+    """
+    Test the fast path that translates well-formed TXT maps in bulk.
+
+    This class contains tests to verify that the fast path builds the same grid as the
+    line by line validation, and that malformed maps still fail with the validation errors.
+    """
+
+    def test_same_grid_as_validation(self, upload):
+        """
+        Test that the fast path and the line by line validation build the same grid on random maps.
+        """
+        rng = random.Random(0)
+        for _ in range(20):
+            rows, cols = rng.randint(1, 12), rng.randint(1, 12)
+            lines = ["".join(rng.choice("ox") for _ in range(cols)) for _ in range(rows)]
+            fast = Map.load(upload("\n".join(lines).encode() + b"\n"))
+
+            # Windows line endings are only handled by the line by line validation
+            validated = Map.load(upload("\r\n".join(lines).encode()))
+
+            assert (fast.rows, fast.cols, fast.grid) == (validated.rows, validated.cols, validated.grid)
+            assert all(fast.is_walkable(x, y) == (lines[y][x] == "o") for y in range(rows) for x in range(cols))
+
+    @pytest.mark.parametrize("content, message", [
+        (b"oxo\nox", "All rows must be the same length."),
+        (b"oxo\n\noxo", "All rows must be the same length."),
+        (b"oxo\nxXo", "Invalid character found."),
+        (b" \n\t", "The file is empty."),
+    ])
+    def test_malformed_maps_raise(self, upload, content: bytes, message: str):
+        """
+        Test that malformed TXT maps still raise the validation errors.
+        """
+        with pytest.raises(ValueError, match=message):
+            Map.load(upload(content))
+
+
+class TestBinaryFormat:
+    """
+    Test the binary map format.
+
+    This class contains tests to verify that exported maps load back with the same tiles,
+    that byte grids are wrapped without copying, and that malformed files raise a ValueError.
+    """
+
+    @pytest.mark.parametrize("encoding", [BIN_BYTE_GRID, BIN_BIT_GRID])
+    def test_round_trip(self, upload, encoding: int):
+        """
+        Test that exporting and loading random maps keeps every tile.
+        """
+        rng = random.Random(0)
+        for _ in range(20):
+            rows, cols = rng.randint(1, 12), rng.randint(1, 12)
+            matrix = [[rng.random() < 0.7 for _ in range(cols)] for _ in range(rows)]
+            map = Map.from_matrix(matrix, rows=rows, cols=cols)
+            loaded = Map.load(upload(map.to_bin(encoding), "map.bin"))
+
+            assert (loaded.rows, loaded.cols) == (rows, cols)
+            assert loaded.grid == map.grid
+            assert loaded.walkable_steps(0, 0, 1, 0, cols) == map.walkable_steps(0, 0, 1, 0, cols)
+            assert loaded.walkable_steps(0, 0, 0, 1, rows) == map.walkable_steps(0, 0, 0, 1, rows)
+
+    def test_byte_grid_is_not_copied(self, upload):
+        """
+        Test that a byte grid is a view over the uploaded content.
+        """
+        content = Map.from_matrix([[True, False], [True, True]], rows=2, cols=2).to_bin()
+        map = Map.load(upload(content, "map.bin"))
+
+        assert isinstance(map.grid, memoryview)
+        assert map.grid.obj is not None and bytes(map.grid.obj) == content
+        assert map.is_walkable(0, 1) and not map.is_walkable(1, 0)
+
+    @pytest.mark.parametrize("content", [
+        b"CRBM",
+        b"XXXX\x01\x00" + (1).to_bytes(4, "little") * 2 + b"\x01",
+        b"CRBM\x01\x00" + (0).to_bytes(4, "little") + (1).to_bytes(4, "little"),
+        b"CRBM\x01\x00" + (1).to_bytes(4, "little") * 2 + b"\x01\x01",
+        b"CRBM\x01\x00" + (1).to_bytes(4, "little") * 2 + b"\x02",
+        b"CRBM\x01\x01" + (3).to_bytes(4, "little") * 2,
+        b"CRBM\x01\x07" + (1).to_bytes(4, "little") * 2 + b"\x01",
+    ])
+    def test_malformed_files_raise(self, upload, content: bytes):
+        """
+        Test that malformed binary maps raise a ValueError.
+        """
+        with pytest.raises(ValueError, match="Failed to load map from BIN"):
+            Map.load(upload(content, "map.bin"))
+
+    def test_unsupported_encoding_export(self):
+        """
+        Test that exporting with an unknown grid encoding raises a ValueError.
+        """
+        with pytest.raises(ValueError):
+            Map.from_matrix([[True]], rows=1, cols=1).to_bin(7)
+
+
+class TestWalkableSteps:
+    """
+    Test the segment-level walkability check of the map.
+
+    This class contains tests to verify that the number of steps that can be taken
+    along a direction stops at the first non-walkable tile or at the map bounds.
+    """
+
+    @pytest.fixture
+    def map(self):
+        """Returns a small map with a few obstacles."""
+        rows = ["ooooo",
+                "oxooo",
+                "ooooo",
+                "oooxo"]
+        return Map.from_matrix([[char == 'o' for char in row] for row in rows], rows=4, cols=5)
+
+    @pytest.mark.parametrize("x, y, dx, dy, steps, expected", [
+        (0, 0, 1, 0, 10, 4),    # East until the map bound
+        (4, 1, -1, 0, 10, 2),   # West until the obstacle at (1, 1)
+        (3, 0, 0, 1, 10, 2),    # South until the obstacle at (3, 3)
+        (1, 2, 0, -1, 10, 0),   # North onto the obstacle at (1, 1)
+        (0, 3, 0, -1, 10, 3),   # North until the map bound
+        (0, 0, 1, 0, 2, 2),     # Fewer steps than the walkable run
+        (2, 2, 1, 0, 0, 0),     # Zero steps
+    ])
+    def test_walkable_steps(self, map, x, y, dx, dy, steps, expected):
+        """
+        Test that walkable_steps matches a step by step walk over the map.
+        """
+        assert map.walkable_steps(x, y, dx, dy, steps) == expected
+
+    def test_walkable_steps_random_maps(self):
+        """
+        Test that the run index agrees with a step by step walk on random maps.
+        """
+        rng = random.Random(0)
+        for _ in range(20):
+            rows, cols = rng.randint(1, 12), rng.randint(1, 12)
+            matrix = [[rng.random() < 0.7 for _ in range(cols)] for _ in range(rows)]
+            map = Map.from_matrix(matrix, rows=rows, cols=cols)
+
+            for y in range(rows):
+                for x in range(cols):
+                    if not matrix[y][x]:
+                        continue
+                    for dx, dy in [(0, -1), (1, 0), (0, 1), (-1, 0)]:
+                        # Walk step by step until the bound or an obstacle
+                        expected, nx, ny = 0, x + dx, y + dy
+                        while 0 <= nx < cols and 0 <= ny < rows and matrix[ny][nx]:
+                            expected, nx, ny = expected + 1, nx + dx, ny + dy
+                        assert map.walkable_steps(x, y, dx, dy, rows + cols) == expected
+
+    def test_compact_lazy_index(self, map):
+        """
+        Test that the runs are indexed with two-byte positions, and that a column is only indexed once the robot
+        moves along it.
+        """
+        size = map.nbytes
+        assert map._row_runs[0][0].itemsize == 2
+        assert map._col_runs == [None] * 5
+
+        assert map.walkable_steps(3, 0, 0, 1, 10) == 2
+        assert map._col_runs[3] is not None and map._col_runs.count(None) == 4
+        assert map.nbytes > size
@@ -0,0 +1,82 @@
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from app.map_cache import MapCache, MapCacheConfig
+
+
+class TestMapCache:
+    """
+    Test the content-addressed cache of parsed maps.
+
+    This class contains tests to verify that identical uploads share the same parsed map,
+    and that the cache stays within its entry and byte limits.
+    """
+
+    def test_hit_on_same_content(self, upload):
+        """
+        Test that uploading the same content twice returns the same map instance, even with another file name.
+        """
+        cache = MapCache(MapCacheConfig())
+        first = cache.load(upload(b"oox\nxoo", "first.txt"))
+        second = cache.load(upload(b"oox\nxoo", "second.txt"))
+
+        assert second is first
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_miss_on_different_content(self, upload):
+        """
+        Test that different contents are parsed into different maps.
+        """
+        cache = MapCache(MapCacheConfig())
+        first = cache.load(upload(b"oox\nxoo"))
+        second = cache.load(upload(b"ooo\nxoo"))
+
+        assert second is not first
+        assert second.is_walkable(2, 0)
+        assert cache.stats()["misses"] == 2
+
+    def test_lru_eviction(self, upload):
+        """
+        Test that the least recently used map is evicted when the cache is full.
+        """
+        cache = MapCache(MapCacheConfig(max_entries=2))
+        cache.load(upload(b"o"))
+        cache.load(upload(b"x"))
+        cache.load(upload(b"o"))  # Use the first map again
+        cache.load(upload(b"oo"))  # Evicts the second map
+
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["evictions"] == 1
+        cache.load(upload(b"o"))
+        assert cache.stats()["hits"] == 2
+
+    def test_byte_limit(self, upload):
+        """
+        Test that maps larger than the byte limit are not cached.
+        """
+        cache = MapCache(MapCacheConfig(max_bytes=16))
+        cache.load(upload(b"o" * 100))
+        assert cache.stats()["entries"] == 0
+
+    def test_invalid_map_not_cached(self, upload):
+        """
+        Test that a file that fails to parse raises every time and is not cached.
+        """
+        cache = MapCache(MapCacheConfig())
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                cache.load(upload(b"oa\noo"))
+        assert cache.stats()["entries"] == 0
+
+    def test_extension_case(self, upload):
+        """
+        Test that a cached map is not returned for an extension that Map.load does not support.
+        """
+        cache = MapCache(MapCacheConfig())
+        cache.load(upload(b"oox\nxoo", "m.txt"))
+        with pytest.raises(ValueError, match="Unsupported file format"):
+            cache.load(upload(b"oox\nxoo", "M.TXT"))
@@ -0,0 +1,139 @@
+import mmap
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from app.map import Map, BIN_BIT_GRID, BIN_BYTE_GRID
+from app.map_store import MapStore, MapStoreConfig
+
+
+@pytest.fixture
+def map_store(tmp_path):
+    """Returns a map store writing to a temporary directory, copying uploads in small chunks."""
+    return MapStore(MapStoreConfig(enabled=True, directory=str(tmp_path), chunk_size=3))
+
+
+class TestMapStore:
+    """
+    Test the memory-mapped on-disk map store.
+
+    This class contains tests to verify that uploaded maps are stored once as byte grids,
+    that stored maps read their tiles through a memory mapping, and that invalid uploads are not kept.
+    """
+
+    MATRIX = [[True, True, False], [False, True, True]]
+
+    @pytest.mark.parametrize("filename, content", [
+        ("map.txt", b"oox\nxoo"),
+        ("map.bin", Map.from_matrix(MATRIX, rows=2, cols=3).to_bin(BIN_BYTE_GRID)),
+        ("map.bin", Map.from_matrix(MATRIX, rows=2, cols=3).to_bin(BIN_BIT_GRID)),
+    ])
+    def test_load_memory_maps_grid(self, upload, map_store, filename: str, content: bytes):
+        """
+        Test that every upload format is stored as a byte grid and read through a memory mapping.
+        """
+        map = map_store.load(upload(content, filename))
+
+        assert isinstance(map.grid.obj, mmap.mmap)
+        assert (map.rows, map.cols) == (2, 3)
+        assert all(map.is_walkable(x, y) == self.MATRIX[y][x] for y in range(2) for x in range(3))
+        assert map.walkable_steps(1, 0, 0, 1, 1) == 1
+
+        stored = os.listdir(map_store.config.directory)
+        assert len(stored) == 1 and stored[0].endswith('.bin')
+
+    def test_same_map_stored_once(self, upload, map_store):
+        """
+        Test that uploading the same content twice keeps a single stored file.
+        """
+        content = Map.from_matrix(self.MATRIX, rows=2, cols=3).to_bin()
+        first = map_store.load(upload(content, "first.bin"))
+        second = map_store.load(upload(content, "second.bin"))
+
+        assert first.grid == second.grid
+        assert len(os.listdir(map_store.config.directory)) == 1
+
+    def test_invalid_upload_not_stored(self, upload, map_store):
+        """
+        Test that an invalid byte grid raises a ValueError and is removed from the store.
+        """
+        content = Map.from_matrix(self.MATRIX, rows=2, cols=3).to_bin()[:-1] + b"\x02"
+        with pytest.raises(ValueError, match="Failed to load map from BIN"):
+            map_store.load(upload(content, "map.bin"))
+
+        assert os.listdir(map_store.config.directory) == []
+
+    def test_max_file_size(self, upload, tmp_path):
+        """
+        Test that uploads larger than the configured limit raise a ValueError and are not stored.
+        """
+        map_store = MapStore(MapStoreConfig(enabled=True, directory=str(tmp_path), max_file_size=16, chunk_size=4))
+        content = Map.from_matrix(self.MATRIX, rows=2, cols=3).to_bin()
+        with pytest.raises(ValueError, match="File is too large"):
+            map_store.load(upload(content, "map.bin"))
+
+        assert os.listdir(tmp_path) == []
+
+    def test_stored_file_kept_on_upload_again(self, upload, map_store):
+        """
+        Test that uploading a stored map again keeps the stored file, rather than replacing it with a new one.
+        """
+        content = Map.from_matrix(self.MATRIX, rows=2, cols=3).to_bin()
+        map_store.load(upload(content, "first.bin"))
+        (name,) = os.listdir(map_store.config.directory)
+        inode = os.stat(os.path.join(map_store.config.directory, name)).st_ino
+        map_store.load(upload(content, "second.bin"))
+
+        assert os.listdir(map_store.config.directory) == [name]
+        assert os.stat(os.path.join(map_store.config.directory, name)).st_ino == inode
+
+    def test_max_text_file_size(self, upload, tmp_path):
+        """
+        Test that TXT and JSON uploads larger than the text limit raise a ValueError before they are parsed.
+        """
+        map_store = MapStore(MapStoreConfig(enabled=True, directory=str(tmp_path), max_text_file_size=4))
+        with pytest.raises(ValueError, match="File is too large"):
+            map_store.load(upload(b"oox\nxoo", "map.txt"))
+
+        assert os.listdir(tmp_path) == []
+
+    def test_max_text_file_size_bit_grid(self, upload, tmp_path):
+        """
+        Test that binary maps with a bit grid, which are unpacked in memory, are limited by the text limit.
+        """
+        map_store = MapStore(MapStoreConfig(enabled=True, directory=str(tmp_path), max_text_file_size=4))
+        content = Map.from_matrix(self.MATRIX, rows=2, cols=3).to_bin(BIN_BIT_GRID)
+        with pytest.raises(ValueError, match="File is too large"):
+            map_store.load(upload(content, "map.bin"))
+
+        assert os.listdir(tmp_path) == []
+
+    def test_max_store_size(self, upload, tmp_path):
+        """
+        Test that the least recently stored maps are removed beyond the store size, while opened maps keep their tiles.
+        """
+        map_store = MapStore(MapStoreConfig(enabled=True, directory=str(tmp_path), max_store_size=40))
+        first = map_store.load(upload(b"oox\nxoo", "first.txt"))
+        (first_name,) = os.listdir(tmp_path)
+        first_path = os.path.join(str(tmp_path), first_name)
+        # Make the first map the least recently stored one, whatever the resolution of the file times
+        os.utime(first_path, (0, 0))
+        map_store.load(upload(b"xoo\noox", "second.txt"))
+        assert len(os.listdir(tmp_path)) == 2
+
+        map_store.load(upload(b"ooo\nooo", "third.txt"))
+        assert len(os.listdir(tmp_path)) == 2
+        assert not os.path.exists(first_path)
+        assert first.is_walkable(0, 0) and not first.is_walkable(2, 0)
+
+    def test_clear_keeps_opened_maps(self, upload, map_store):
+        """
+        Test that clearing the store removes the files, while maps already opened keep their tiles.
+        """
+        map = map_store.load(upload(b"oox\nxoo", "map.txt"))
+        map_store.clear()
+
+        assert os.listdir(map_store.config.directory) == []
+        assert map.is_walkable(0, 0) and not map.is_walkable(2, 0)
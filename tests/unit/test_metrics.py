@@ -0,0 +1,80 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from app.cleaning_robot import BaseCleaningRobot, PremiumCleaningRobot
+from app.map import Map
+from app.robot_path import RobotPath
+
+
+class TestCleaningMetrics:
+    """
+    Test the metrics-only cleaning sessions.
+
+    This class contains tests to verify that the metrics of a session match the tiles of its full report,
+    and that they are stored like the full sessions, for base and premium robots.
+    """
+
+    @pytest.mark.parametrize("robot_class", [BaseCleaningRobot, PremiumCleaningRobot])
+    def test_same_counts_as_full_report(self, random_map, random_path, robot_class):
+        """
+        Test that the metrics and stored sessions match the full reports on random maps and paths,
+        including premium sessions that alternate between both modes.
+        """
+        rng = random.Random(0)
+        for _ in range(20):
+            rows, cols = rng.randint(1, 10), rng.randint(1, 10)
+            map = random_map(rng, rows, cols)
+            full_robot, metrics_robot = robot_class(map=map), robot_class(map=map)
+            paths = [random_path(rng, rows, cols) for _ in range(6)]
+            # A base robot cleans every visit, so its reports list the visited tiles
+            visits = [report.cleaned_tiles for report in BaseCleaningRobot(map=map).clean_batch(paths, store=False)]
+
+            expected = full_robot.simulate(paths)
+            results = (metrics_robot.simulate(paths[:3], "metrics") + metrics_robot.simulate(paths[3:4]) +
+                       metrics_robot.simulate(paths[4:], "metrics"))
+            for i, ((report, session), (metrics, metrics_session)) in enumerate(zip(expected, results)):
+                assert (metrics_session.number_of_actions, metrics_session.number_of_cleaned_tiles) == \
+                       (session.number_of_actions, session.number_of_cleaned_tiles)
+                if i == 3:
+                    assert metrics == report
+                    continue
+                assert (metrics.status, metrics.error) == (report.status, report.error)
+                assert metrics.cleaned_tiles == len(report.cleaned_tiles)
+                assert metrics.path_length == session.number_of_actions
+                assert metrics.unique_tiles == len(set(visits[i]))
+                assert metrics.revisits == len(visits[i]) - len(set(visits[i]))
+                assert metrics.coverage == 100 * len(set(visits[i])) / map.walkable_tiles
+
+    def test_metrics(self):
+        """
+        Test the coverage, revisits and path length of a session going back and forth.
+        """
+        map = Map.from_matrix([[True, True, True, False]], rows=1, cols=4)
+        path = RobotPath(x=0, y=0, actions=[{"direction": "east", "steps": 2}, {"direction": "west", "steps": 1},
+                                            {"direction": "east", "steps": 2}])
+        ((metrics, session),) = BaseCleaningRobot(map=map).simulate([path], report_format="metrics")
+
+        assert metrics.status == "error" and "non-walkable tile at (3, 0)" in metrics.error
+        assert (metrics.unique_tiles, metrics.revisits, metrics.path_length) == (3, 2, 4)
+        assert metrics.coverage == 100
+        assert metrics.cleaned_tiles == session.number_of_cleaned_tiles == 5
+
+    def test_previous_session_on_another_map(self):
+        """
+        Test that a premium robot counts the tiles of a previous session on a map of another size like clean().
+        """
+        path = RobotPath(x=0, y=0, actions=[{"direction": "east", "steps": 5}, {"direction": "south", "steps": 1}])
+        next_path = RobotPath(x=0, y=0, actions=[{"direction": "south", "steps": 5}])
+        sessions = []
+        for report_format in ("full", "compact", "metrics"):
+            robot = PremiumCleaningRobot(map=Map.from_matrix([[True] * 6] * 3, rows=3, cols=6))
+            robot.simulate([path])
+            robot.map = Map.from_matrix([[True] * 3] * 6, rows=6, cols=3)
+            ((_, session),) = robot.simulate([next_path], report_format)
+            sessions.append(session.number_of_cleaned_tiles)
+
+        assert sessions == [5, 5, 5]
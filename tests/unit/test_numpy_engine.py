@@ -0,0 +1,118 @@
+import io
+import os
+import random
+import sys
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from app import numpy_engine
+from app.app import stream_cleaning_report
+from app.cleaning_robot import BaseCleaningRobot, PremiumCleaningRobot
+from app.map import Map
+from app.robot_path import RobotPath
+
+
+# Numbers of steps of the random actions, including actions far longer than the maps
+STEPS = (0, 1, 2, 3, 5, 2 ** 40)
+
+
+def stream_bytes(robot) -> bytes:
+    """Returns the report streamed by a cleaning session of the robot."""
+    return b"".join(stream_cleaning_report(robot))
+
+
+class TestNumpyEngine:
+    """
+    Test the NumPy simulation engine.
+
+    This class contains tests to verify that the NumPy engine reports exactly what the Python engine reports,
+    for base and premium robots, whether the path completes or ends on an error.
+    """
+
+    @pytest.mark.parametrize("robot_class", [BaseCleaningRobot, PremiumCleaningRobot])
+    @pytest.mark.parametrize("block_steps", [1 << 20, 7])
+    def test_same_output_as_python_engine(self, monkeypatch, random_map, random_path, robot_class, block_steps: int):
+        """
+        Test that both engines stream the same tiles and reports on random maps and paths,
+        including when the path is split into small blocks of actions.
+        """
+        monkeypatch.setattr(numpy_engine, "_BLOCK_STEPS", block_steps)
+        rng = random.Random(block_steps)
+        for _ in range(20):
+            rows, cols = rng.randint(1, 12), rng.randint(1, 12)
+            map = random_map(rng, rows, cols)
+            python_robot = robot_class(map=map, engine="python")
+            numpy_robot = robot_class(map=map, engine="numpy")
+            # Consecutive sessions of premium robots depend on each other
+            for _ in range(5):
+                python_robot.path = numpy_robot.path = random_path(rng, rows, cols, STEPS, max_actions=40)
+                python_robot._batch_sessions = []
+                numpy_robot._batch_sessions = []
+                assert stream_bytes(numpy_robot) == stream_bytes(python_robot)
+
+    @pytest.mark.parametrize("robot_class", [BaseCleaningRobot, PremiumCleaningRobot])
+    def test_streamed_path(self, robot_class):
+        """
+        Test that the NumPy engine follows a streamed path like a loaded one, including a malformed one.
+        """
+        map = Map.from_matrix([[True] * 4, [True, False, True, True]], rows=2, cols=4)
+        actions = b"0 0\neast 3\nsouth 1\nwest 1\nwest 1\n"
+        path = RobotPath.load(FileStorage(stream=io.BytesIO(actions), filename="actions.txt"))
+        stream = RobotPath.stream(FileStorage(stream=io.BytesIO(actions), filename="actions.txt"))
+
+        expected = robot_class(map=map, path=path, engine="python").simulate([path])[0][0]
+        report = robot_class(map=map, engine="numpy").simulate([stream])[0][0]
+        assert report == expected
+        assert report.error == "Robot attempted to move to a non-walkable tile at (1, 1)."
+
+        # The valid actions before a malformed one are followed before the parsing error ends the session
+        actions = b"0 0\neast 1\neast 1\nbogus"
+        expected = robot_class(map=map, engine="python").simulate(
+            [RobotPath.stream(FileStorage(stream=io.BytesIO(actions), filename="actions.txt"))])[0][0]
+        report = robot_class(map=map, engine="numpy").simulate(
+            [RobotPath.stream(FileStorage(stream=io.BytesIO(actions), filename="actions.txt"))])[0][0]
+        assert report == expected
+        assert report.cleaned_tiles == [(0, 0), (1, 0), (2, 0)]
+        assert report.error.startswith("Failed to load actions from TXT")
+
+    @pytest.mark.parametrize("robot_class", [BaseCleaningRobot, PremiumCleaningRobot])
+    def test_streamed_path_beyond_steps_array(self, robot_class):
+        """
+        Test that a streamed action with more steps than the steps array holds ends on the map boundary
+        like with the Python engine.
+        """
+        map = Map.from_matrix([[True] * 4], rows=1, cols=4)
+        actions = f"0 0\neast 1\neast {2 ** 70}\n".encode()
+        reports = [robot_class(map=map, engine=engine).simulate(
+            [RobotPath.stream(FileStorage(stream=io.BytesIO(actions), filename="actions.txt"))])[0][0]
+            for engine in ("python", "numpy")]
+        assert reports[1] == reports[0]
+        assert reports[1].error == "Robot moved out of map bounds at (4, 0)."
+
+    def test_previous_session_on_another_map(self, random_map, random_path):
+        """
+        Test that a premium robot skips the tiles of a previous session on a map of another size like the Python
+        engine, by their coordinates.
+        """
+        rng = random.Random(1)
+        for _ in range(20):
+            robots = [PremiumCleaningRobot(map=random_map(rng, 3, 6), engine=engine) for engine in ("python", "numpy")]
+            robots[1].map = robots[0].map
+            path = random_path(rng, 3, 6, STEPS, max_actions=40)
+            next_map, next_path = random_map(rng, 6, 3), random_path(rng, 6, 3, STEPS, max_actions=40)
+
+            reports = []
+            for robot in robots:
+                robot.simulate([path])
+                robot.map = next_map
+                reports.append(robot.simulate([next_path])[0][0])
+            assert reports[1] == reports[0]
+
+    def test_unsupported_engine(self):
+        """
+        Test that an unknown engine raises a ValueError.
+        """
+        with pytest.raises(ValueError, match="Unsupported simulation engine"):
+            BaseCleaningRobot(engine="fortran")
@@ -0,0 +1,112 @@
+import random
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from app.cleaning_robot import BaseCleaningRobot, PremiumCleaningRobot
+from app.report import CleaningReport, RunEncoder, decode_runs
+
+
+def encode_runs(tiles: list) -> list:
+    """Returns the runs of the given tiles, added one by one to a run encoder."""
+    encoder = RunEncoder()
+    for x, y in tiles:
+        encoder.add(x, y)
+    return encoder.runs
+
+
+class TestCompactReport:
+    """
+    Test the run-length encoder of the cleaned tiles used by the compact report format.
+
+    This class contains tests to verify that straight moves collapse into a single run
+    and that decoding the runs gives back the exact list of tiles.
+    """
+
+    def test_encode_straight_segments(self):
+        """
+        Test that consecutive tiles moving in the same direction are encoded as one run.
+        """
+        tiles = [(3, 3), (4, 3), (5, 3), (5, 2), (5, 1), (4, 1)]
+        assert encode_runs(tiles) == [[3, 3, "east", 2], [5, 2, "north", 1], [4, 1, None, 0]]
+
+    def test_encode_isolated_tiles(self):
+        """
+        Test that tiles which are not adjacent to the previous one start a new run.
+        """
+        tiles = [(0, 0), (2, 2), (2, 3), (7, 1)]
+        assert encode_runs(tiles) == [[0, 0, None, 0], [2, 2, "south", 1], [7, 1, None, 0]]
+        assert encode_runs([]) == []
+
+    def test_round_trip(self):
+        """
+        Test that decoding the runs of random tile lists gives back the same tiles.
+        """
+        rng = random.Random(0)
+        for _ in range(50):
+            x, y = rng.randint(0, 9), rng.randint(0, 9)
+            tiles = [(x, y)]
+            for _ in range(rng.randint(0, 40)):
+                dx, dy = rng.choice([(0, -1), (1, 0), (0, 1), (-1, 0), (3, 2)])
+                x, y = x + dx, y + dy
+                tiles.append((x, y))
+            assert decode_runs(encode_runs(tiles)) == tiles
+
+    def test_encode_segments(self):
+        """
+        Test that encoding whole straight segments gives the same runs as encoding their tiles one by one.
+        """
+        rng = random.Random(0)
+        for _ in range(50):
+            x, y = rng.randint(0, 9), rng.randint(0, 9)
+            encoder, tiles = RunEncoder(), [(x, y)]
+            encoder.add(x, y)
+            for _ in range(rng.randint(0, 20)):
+                dx, dy = rng.choice([(0, -1), (1, 0), (0, 1), (-1, 0)])
+                steps = rng.choice([0, 1, 2, 3, 4, 10])
+                encoder.add_segment(x, y, dx, dy, steps)
+                tiles += [(x + dx * i, y + dy * i) for i in range(1, steps + 1)]
+                x, y = x + dx * steps, y + dy * steps
+            assert encoder.runs == encode_runs(tiles)
+
+
+class TestCleaningReport:
+    """
+    Test the structured cleaning report returned by the robots.
+    """
+
+    def test_to_dict(self):
+        """
+        Test the dict representation of a report.
+        """
+        report = CleaningReport.build([(0, 0), (1, 0), (2, 0)], status="error", error="Robot moved out of map bounds.")
+
+        assert report.to_dict() == {"cleaned_tiles": [(0, 0), (1, 0), (2, 0)], "status": "error",
+                                    "error": "Robot moved out of map bounds."}
+
+
+class TestCompactCleaningSession:
+    """
+    Test the compact cleaning sessions, whose runs are encoded from the segments of the path.
+    """
+
+    @pytest.mark.parametrize("robot_class", [BaseCleaningRobot, PremiumCleaningRobot])
+    def test_same_runs_as_full_report(self, random_map, random_path, robot_class):
+        """
+        Test that the compact reports and stored sessions match the full reports on random maps and paths.
+        """
+        rng = random.Random(0)
+        for _ in range(20):
+            rows, cols = rng.randint(1, 10), rng.randint(1, 10)
+            map = random_map(rng, rows, cols)
+            paths = [random_path(rng, rows, cols, max_actions=20) for _ in range(4)]
+
+            expected = robot_class(map=map).simulate(paths)
+            results = robot_class(map=map).simulate(paths, "compact")
+            for (report, session), (compact, compact_session) in zip(expected, results):
+                assert compact.to_dict() == {"cleaned_runs": encode_runs(report.cleaned_tiles),
+                                             "status": report.status, "error": report.error}
+                assert (compact_session.number_of_actions, compact_session.number_of_cleaned_tiles) == \
+                       (session.number_of_actions, session.number_of_cleaned_tiles)
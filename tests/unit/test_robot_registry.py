@@ -0,0 +1,88 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from app.cleaning_robot import BaseCleaningRobot, PremiumCleaningRobot
+from app.robot_registry import RobotRegistry, RobotRegistryConfig
+
+
+class TestRobotRegistry:
+    """
+    Test the registry of cleaning robots keyed by robot ID.
+
+    This class contains tests to verify that robots are created on demand with the requested type,
+    and that the least recently used idle robots are evicted beyond the configured size.
+    """
+
+    def test_get_or_create(self):
+        """
+        Test that the same robot is returned for the same ID and type, and replaced for another type.
+        """
+        registry = RobotRegistry(RobotRegistryConfig())
+        base = registry.get_or_create("r1")
+        assert isinstance(base.robot, BaseCleaningRobot)
+        assert registry.get_or_create("r1", "base") is base
+        assert registry.get("r1") is base
+
+        premium = registry.get_or_create("r1", "premium")
+        assert isinstance(premium.robot, PremiumCleaningRobot)
+        assert registry.get("r1") is premium
+        assert len(registry) == 1
+
+    def test_get_or_create_without_type(self):
+        """
+        Test that a robot is kept whatever its type when no type is given, and created as a base robot otherwise.
+        """
+        registry = RobotRegistry(RobotRegistryConfig())
+        assert isinstance(registry.get_or_create("r1").robot, BaseCleaningRobot)
+
+        premium = registry.get_or_create("r2", "premium")
+        assert registry.get_or_create("r2") is premium
+
+    def test_unsupported_type(self):
+        """
+        Test that creating a robot of an unknown type raises a ValueError.
+        """
+        registry = RobotRegistry(RobotRegistryConfig())
+        with pytest.raises(ValueError, match="Unsupported robot type"):
+            registry.get_or_create("r1", "deluxe")
+        assert registry.get("r1") is None
+
+    def test_evicts_least_recently_used(self):
+        """
+        Test that the least recently used robot is evicted beyond the maximum number of robots.
+        """
+        registry = RobotRegistry(RobotRegistryConfig(max_robots=2))
+        registry.get_or_create("r1")
+        registry.get_or_create("r2")
+        registry.get("r1")
+        registry.get_or_create("r3")
+
+        assert registry.get("r2") is None
+        assert registry.get("r1") is not None and registry.get("r3") is not None
+        assert registry.evictions == 1
+
+    def test_busy_robot_not_evicted(self):
+        """
+        Test that a robot whose lock is held is kept, and that the next idle robot is evicted instead.
+        """
+        registry = RobotRegistry(RobotRegistryConfig(max_robots=2))
+        busy = registry.get_or_create("r1")
+        registry.get_or_create("r2")
+        with busy.lock:
+            registry.get_or_create("r3")
+
+        assert registry.get("r1") is busy
+        assert registry.get("r2") is None
+
+    def test_remove(self):
+        """
+        Test that a removed robot is no longer returned.
+        """
+        registry = RobotRegistry(RobotRegistryConfig())
+        registry.get_or_create("r1")
+        assert registry.remove("r1")
+        assert not registry.remove("r1")
+        assert registry.get("r1") is None
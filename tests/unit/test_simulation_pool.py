@@ -0,0 +1,102 @@
+import os
+import random
+import sys
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from app.cleaning_robot import BaseCleaningRobot
+from app.map import Map
+from app.robot_path import RobotPath
+from app.simulation_pool import SimulationPool, SimulationPoolConfig
+
+
+@pytest.fixture(scope="module")
+def simulation_pool():
+    """Returns a pool of two worker processes, simulating batches of any size."""
+    pool = SimulationPool(SimulationPoolConfig(enabled=True, max_workers=2, min_batch_size=1))
+    yield pool
+    pool.close()
+
+
+class TestSimulationPool:
+    """
+    Test the parallel simulation of independent cleaning sessions.
+
+    This class contains tests to verify that the pool returns the same reports and sessions as a serial
+    simulation, in the order of the paths, and that it follows the map it is given.
+    """
+
+    def test_same_results_as_serial(self, simulation_pool, random_map, random_path):
+        """
+        Test that the pool returns the reports and sessions of a serial simulation, in the same order.
+        """
+        rng = random.Random(0)
+        map = random_map(rng, 10, 12, walkable=0.8)
+        paths = [random_path(rng, 10, 12, steps=(0, 1, 2, 3, 4), max_actions=20) for _ in range(50)]
+
+        serial = BaseCleaningRobot(map=map).simulate(paths)
+        parallel = simulation_pool.simulate(map, paths)
+
+        assert [report for report, _ in parallel] == [report for report, _ in serial]
+        assert [(session.session_final_state, session.number_of_actions, session.number_of_cleaned_tiles)
+                for _, session in parallel] == \
+               [(session.session_final_state, session.number_of_actions, session.number_of_cleaned_tiles)
+                for _, session in serial]
+
+    def test_follows_map_changes(self, simulation_pool):
+        """
+        Test that the workers simulate on the latest map given to the pool.
+        """
+        path = RobotPath(x=0, y=0, actions=[{"direction": "east", "steps": 2}])
+        walkable = Map.from_matrix([[True, True, True]], rows=1, cols=3)
+        blocked = Map.from_matrix([[True, False, True]], rows=1, cols=3)
+
+        assert simulation_pool.simulate(walkable, [path])[0][0].status == "completed"
+        assert simulation_pool.simulate(blocked, [path])[0][0].status == "error"
+        assert simulation_pool.simulate(walkable, [path])[0][0].status == "completed"
+
+    def test_recovers_from_dead_worker(self, simulation_pool):
+        """
+        Test that a batch still succeeds after the workers were killed, with a new set of workers.
+        """
+        path = RobotPath(x=0, y=0, actions=[{"direction": "east", "steps": 2}])
+        map = Map.from_matrix([[True, True, True]], rows=1, cols=3)
+        assert simulation_pool.simulate(map, [path])[0][0].status == "completed"
+
+        for process in list(simulation_pool._executor._processes.values()):
+            process.kill()
+            process.join()
+        assert simulation_pool.simulate(map, [path])[0][0].status == "completed"
+
+    def test_falls_back_to_serial(self, monkeypatch, random_path):
+        """
+        Test that a batch is simulated in the calling process when the pool keeps breaking.
+        """
+        class BrokenExecutor:
+            def map(self, *args, **kwargs):
+                raise BrokenProcessPool()
+
+            def shutdown(self, **kwargs):
+                pass
+
+        pool = SimulationPool(SimulationPoolConfig(enabled=True, max_workers=1, min_batch_size=1))
+        monkeypatch.setattr(pool, "_SimulationPool__start", lambda: BrokenExecutor())
+        rng = random.Random(1)
+        map = Map.from_matrix([[True] * 4 for _ in range(4)], rows=4, cols=4)
+        paths = [random_path(rng, 4, 4, steps=(0, 1, 2, 3, 4), max_actions=20) for _ in range(5)]
+        try:
+            assert [report for report, _ in pool.simulate(map, paths)] == \
+                   [report for report, _ in BaseCleaningRobot(map=map).simulate(paths)]
+        finally:
+            pool.close()
+
+    def test_accepts(self):
+        """
+        Test that only batches of at least the minimum size are simulated in the pool.
+        """
+        pool = SimulationPool(SimulationPoolConfig(min_batch_size=4))
+        assert not pool.accepts(3)
+        assert pool.accepts(4)
+        pool.close()